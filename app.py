@@ -1,39 +1,107 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
+import hashlib
 import json
-import openai
+import math
 import os
-import requests
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from PIL import Image
-import re
-import firebase_admin
-from firebase_admin import credentials, storage
+from logo_cache import logo_cache, logo_size_for
+from http_pool import get_session, pool_stats
+from result_cache import CACHE_MAX_ENTRIES, build_result_cache, content_path
+from job_queue import QUEUE_MAX_PENDING, QueueFull, build_job_queue
+from image_encoder import CONTENT_TYPES, EXTENSIONS, encode_image, negotiate_format
+from openai_client import get_openai, openai_client
+from storage_backend import build_storage
+from write_behind import build_write_behind
+from metrics import CONTENT_TYPE, cache_samples, metrics
 from flask_cors import CORS
 
 app = Flask(__name__)
 CORS(app)
 
-# Configurar Firebase Admin SDK para desplegarla en Render
-firebase_cred_json = os.getenv("FIREBASE_ADMIN_SDK")
-firebase_cred = json.loads(firebase_cred_json)
-cred = credentials.Certificate(firebase_cred)  # Credenciales JSON
-firebase_admin.initialize_app(cred, {
-    'storageBucket': 'artmind-9f80a.appspot.com'  # Tu bucket de Firebase
-})
+# Firebase, OpenAI, Pillow y NumPy se cargan en el primer uso o en el calentamiento (warm_up),
+# no al importar la app: así el arranque en frío de Render sirve antes la primera petición
+FIREBASE_BUCKET = 'artmind-9f80a.appspot.com'  # Tu bucket de Firebase
+firebase_lock = threading.Lock()
 
-# Configurar OpenAI key para desplegar en Render
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Logos disponibles (variantes de marca): "nombre=ruta,nombre2=ruta2"
+LOGOS = dict(
+    item.split("=", 1) for item in os.getenv("ARTMIND_LOGOS", "default=logo.png").split(",") if "=" in item
+)
+DEFAULT_LOGO = next(iter(LOGOS.values()), "logo.png")
 
+# Caché de resultados por prompt normalizado (RESULT_CACHE_BACKEND=memory|sqlite)
+result_cache = build_result_cache()
+# Los aciertos confían en la ruta direccionada por contenido; como mucho cada RESULT_CACHE_VERIFY_SECONDS
+# por ruta se comprueba en segundo plano que el objeto sigue en el almacenamiento (y si no, se invalida)
+RESULT_CACHE_VERIFY_SECONDS = float(os.getenv("RESULT_CACHE_VERIFY_SECONDS", "300"))
+object_checks = OrderedDict()  # Ruta: instante (monotonic) de la última comprobación
+object_checks_lock = threading.Lock()
+object_check_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="object-check")
 
-def generate_image(prompt):
+# Derivados (miniatura, mediano, completo) generados tras añadir el logo; IMAGE_DERIVATIVES para configurarlos
+DERIVATIVES_ENABLED = os.getenv("IMAGE_DERIVATIVES_ENABLED", "1") == "1"
+
+# Opciones de marca de agua que se aceptan en la petición, su tipo y su rango válido
+WATERMARK_OPTION_TYPES = {"opacity": float, "position": str, "margin": int, "tiled": bool, "angle": float}
+WATERMARK_OPTION_RANGES = {"opacity": (0.0, 1.0), "margin": (0, 1024), "angle": (-360.0, 360.0)}
+
+# Tamaño de bloque para las subidas en streaming (múltiplo de 256 KB, exigido por Cloud Storage)
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(256 * 1024)))
+
+# Ruta opcional para guardar en disco la imagen con el logo (solo para depuración)
+DEBUG_IMAGE_PATH = os.getenv("DEBUG_IMAGE_WITH_LOGO_PATH")
+
+
+def get_bucket():
+    """Inicializa Firebase Admin SDK la primera vez (credenciales en FIREBASE_ADMIN_SDK) y devuelve el bucket."""
+    import firebase_admin
+    from firebase_admin import credentials, storage
+
+    with firebase_lock:
+        if not firebase_admin._apps:
+            firebase_cred = json.loads(os.getenv("FIREBASE_ADMIN_SDK"))
+            cred = credentials.Certificate(firebase_cred)  # Credenciales JSON
+            firebase_admin.initialize_app(cred, {'storageBucket': FIREBASE_BUCKET})
+    return storage.bucket()
+
+
+# Almacenamiento de las imágenes (STORAGE_BACKEND=firebase|local|memory)
+image_storage = build_storage(get_bucket)
+# Subida diferida (WRITE_BEHIND=1): la respuesta no espera a la subida; los objetos esperan en un spool local
+write_behind = build_write_behind(image_storage)
+
+
+def warm_up():
+    """Carga los módulos pesados e inicializa los clientes antes de la primera petición."""
+    try:
+        from PIL import Image  # noqa: F401
+        import watermark  # noqa: F401
+        import derivatives  # noqa: F401
+
+        get_openai()
+        get_session()
+        image_storage.connect()
+        # Precargar los logos ya redimensionados para el tamaño de DALL·E (1024x1024)
+        logo_cache.preload(LOGOS.values(), [logo_size_for((1024, 1024))])
+    except Exception as e:
+        print(f"Error en el calentamiento: {e}")
+
+
+@metrics.timed("generate_image")
+def generate_image(prompt, variation=0):
     """Genera una imagen basada en un prompt usando DALL·E y devuelve el revised_prompt."""
     try:
         # Llamada a la API de OpenAI para generar la imagen
-        response = openai.Image.create(
+        response = openai_client.create_image(
             model="dall-e-3",
             prompt=prompt,
             size="1024x1024",
-            n=1
+            n=1,
+            variation=variation
         )
         # Obtener el revised_prompt y la URL de la imagen generada
         revised_prompt = response['data'][0].get('revised_prompt', prompt)  # Usamos revised_prompt si está disponible
@@ -45,101 +113,523 @@ def generate_image(prompt):
         return None, None
 
 
-def add_logo_to_image(image_url, logo_path="logo.png"):
-    """Añade un logo a la imagen generada."""
+@metrics.timed("add_logo_to_image", bytes_result=True)
+def add_logo_to_image(image_url, logo_path=DEFAULT_LOGO, output_path=None, output_format=None,
+                      watermark_options=None):
+    """Añade un logo a la imagen generada y la devuelve codificada en memoria (BytesIO).
+
+    El formato y sus ajustes (compresión, calidad) salen de image_encoder; por defecto PNG.
+    Con watermark_options (opacity, position, margin, tiled, angle) se usa el motor NumPy de watermark.py.
+    Si se indica output_path, la imagen también se escribe en disco (solo para depuración).
+    """
+    from PIL import Image
+
     try:
         # Descargar la imagen desde la URL
-        response = requests.get(image_url)
+        response = get_session().get(image_url)
         response.raise_for_status()  # Asegura que la solicitud fue exitosa
-        image = Image.open(BytesIO(response.content))
 
-        # Abrir el logo
-        logo = Image.open(logo_path)
+        with Image.open(BytesIO(response.content)) as image:
+            if watermark_options:
+                from watermark import get_watermark
 
-        # Redimensionar el logo si es necesario
-        logo.thumbnail((image.width // 5, image.height // 5))
+                # Opacidad, posición o mosaico: mezcla alfa en NumPy sobre los recortes del logo
+                image = get_watermark(logo_path, **watermark_options).apply(image)
+            else:
+                # Superponer el logo (ya redimensionado y en caché) en la esquina inferior derecha
+                logo_cache.paste(image, logo_path, logo_size_for(image.size))
 
-        # Superponer el logo en la esquina inferior derecha de la imagen
-        image.paste(logo, (image.width - logo.width, image.height - logo.height), logo)
+            # Codificar la imagen con el logo directamente en memoria
+            buffer = encode_image(image, output_format)
 
-        # Guardar la imagen temporalmente con el logo
-        image_with_logo_path = "image_with_logo.png"
-        image.save(image_with_logo_path)
+        if output_path:
+            with open(output_path, "wb") as file:
+                file.write(buffer.getbuffer())
 
-        # Cerrar los archivos abiertos
-        image.close()
-        logo.close()
-
-        return image_with_logo_path
+        buffer.seek(0)
+        return buffer
     except Exception as e:
         print(f"Error al añadir el logo a la imagen: {e}")
         return None
 
 
-def clean_filename(text):
-    """Limpia el texto para que sea un nombre de archivo válido."""
-    return re.sub(r'[^A-Za-z0-9]+', '_', text)
-
+@metrics.timed("upload_to_firebase", bytes_arg=0)
+def upload_to_firebase(image, destination_blob_name, skip_if_exists=False, content_type="image/png",
+                       metadata=None):
+    """Sube la imagen al almacenamiento configurado (Firebase por defecto) y retorna la URL pública.
 
-def upload_to_firebase(image_path, destination_blob_name):
-    """Sube la imagen a Firebase Storage y retorna la URL."""
+    `image` puede ser un buffer en memoria (BytesIO), bytes o la ruta de un archivo.
+    Con skip_if_exists (rutas direccionadas por contenido) no se vuelve a subir un objeto que ya existe.
+    """
     try:
-        bucket = storage.bucket()  # Obtener el bucket de Firebase
-        blob = bucket.blob(destination_blob_name)  # Crear un blob en la ruta de destino
-
-        # Subir el archivo a Firebase Storage
-        blob.upload_from_filename(image_path)
+        if write_behind:
+            # Se guarda en el spool y se devuelve ya la URL final; la subida sigue en segundo plano
+            return write_behind.enqueue(image, destination_blob_name, content_type, metadata, skip_if_exists)
+        # La ACL pública y los metadatos van en la misma petición que los datos
+        return image_storage.upload(image, destination_blob_name, content_type, metadata, skip_if_exists=skip_if_exists)
+    except Exception as e:
+        print(f"Error al subir a Firebase: {e}")
+        return None
 
-        # Hacer que el archivo sea público
-        blob.make_public()
 
-        # Retornar la URL pública del archivo subido
-        return blob.public_url
+def upload_derivatives(derivatives):
+    """Sube en un solo lote los derivados [(nombre, bytes, formato)] y devuelve {nombre: ruta} de los subidos."""
+    items = [
+        (data, content_path(data, "generated_images/derivatives", EXTENSIONS[fmt]), CONTENT_TYPES[fmt],
+         {"derivative": name})
+        for name, data, fmt in derivatives
+    ]
+    if write_behind:
+        urls = [write_behind.enqueue(*item, skip_if_exists=True) for item in items]
+    else:
+        urls = image_storage.upload_many(items, skip_if_exists=True)
+    return {name: item[1] for (name, _, _), item, url in zip(derivatives, items, urls) if url}
+
+
+def schedule_object_check(prompt, cache_variant, path):
+    """Programa en segundo plano la comprobación de que el objeto de un acierto sigue en el almacenamiento.
+
+    Cada ruta se comprueba como mucho una vez cada RESULT_CACHE_VERIFY_SECONDS, así un acierto no
+    paga una llamada a Cloud Storage. Si el objeto ya no existe, la entrada se borra de la caché.
+    """
+    now = time.monotonic()
+    with object_checks_lock:
+        checked_at = object_checks.get(path)
+        if checked_at is not None and now - checked_at < RESULT_CACHE_VERIFY_SECONDS:
+            return
+        object_checks[path] = now
+        object_checks.move_to_end(path)
+        while len(object_checks) > CACHE_MAX_ENTRIES:
+            object_checks.popitem(last=False)
+    object_check_executor.submit(check_object, prompt, cache_variant, path)
+
+
+def check_object(prompt, cache_variant, path):
+    """Borra la entrada de la caché si su objeto ya no está ni en el almacenamiento ni en el spool."""
+    if write_behind and write_behind.is_pending(path):
+        return
+    try:
+        if image_storage.exists(path):
+            return
     except Exception as e:
-        print(f"Error al subir a Firebase: {e}")
+        # Sin respuesta del almacenamiento no se invalida: se vuelve a comprobar en el siguiente acierto
+        print(f"Error al comprobar {path} en el almacenamiento: {e}")
+        with object_checks_lock:
+            object_checks.pop(path, None)
+        return
+    result_cache.delete(prompt, *cache_variant)
+    with object_checks_lock:
+        object_checks.pop(path, None)
+
+
+def cache_result(prompt, cache_variant, revised_prompt, path, derivative_paths=None):
+    """Guarda en la caché las rutas de los objetos, no sus URLs: las URLs se construyen al servir el acierto.
+
+    Con la subida diferida solo se guarda cuando todos los objetos están subidos: si alguno sigue
+    pendiente, se vuelve a intentar al confirmarse su subida.
+    """
+    if write_behind:
+        pending = [p for p in (path, *(derivative_paths or {}).values()) if write_behind.is_pending(p)]
+        if pending:
+            write_behind.on_uploaded(pending[0], lambda: cache_result(prompt, cache_variant, revised_prompt, path,
+                                                                      derivative_paths))
+            return
+    result_cache.set(prompt, {"revised_prompt": revised_prompt, "path": path,
+                              "derivatives": derivative_paths or {}}, *cache_variant)
+
+
+def cached_result(prompt, cache_variant, url_root=None):
+    """Resultado guardado para el prompt, con las URLs actuales; None si no hay.
+
+    Un objeto borrado del almacenamiento no se detecta en el acierto, sino en la comprobación en
+    segundo plano (schedule_object_check), que invalida la entrada para las peticiones siguientes.
+    """
+    cached = result_cache.get(prompt, *cache_variant)
+    if not cached:
+        return None
+    if "path" not in cached:
+        result_cache.delete(prompt, *cache_variant)
+        return None
+    schedule_object_check(prompt, cache_variant, cached["path"])
+    firebase_url = image_storage.public_url(cached["path"])
+    # La URL de DALL·E caduca al cabo de una hora: en un acierto se devuelve la del almacenamiento
+    result = {"revised_prompt": cached["revised_prompt"], "image_url": firebase_url, "firebase_url": firebase_url,
+              "cached": True}
+    if cached["derivatives"]:
+        result["derivatives"] = {name: image_storage.public_url(path) for name, path in cached["derivatives"].items()}
+    add_upload_status(result, cached["path"], url_root)
+    return result
+
+
+def add_upload_status(result, path, url_root=None):
+    """Si el objeto aún se está subiendo, indica en el resultado la URL con la que se sirve desde el spool.
+
+    `url_root` es la URL raíz de la petición original (request.url_root), con la que se construye
+    local_url cuando WRITE_BEHIND_BASE_URL no está configurada.
+    """
+    if write_behind and write_behind.is_pending(path):
+        # La URL final puede tardar en existir: mientras tanto la imagen se sirve desde el spool
+        result["upload_status"] = "pending"
+        result["local_url"] = write_behind.local_url(path, url_root)
+
+
+@metrics.timed("stream_to_firebase")
+def stream_to_firebase(image_url, destination_blob_name):
+    """Copia la imagen de la URL al almacenamiento en streaming, sin cargarla entera en memoria.
+
+    La descarga se lee por bloques de STREAM_CHUNK_SIZE y cada bloque se envía con una subida
+    reanudable, así que la memoria por petición queda acotada a unos cientos de KB.
+    """
+    try:
+        with get_session().get(image_url, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            return image_storage.upload_stream(response.raw, destination_blob_name,
+                                         response.headers.get("Content-Type", "image/png"),
+                                         chunk_size=STREAM_CHUNK_SIZE)
+    except Exception as e:
+        print(f"Error al subir a Firebase en streaming: {e}")
         return None
 
 
+def parse_watermark_options(options):
+    """Valida las opciones de marca de agua de la petición; None si no hay ninguna."""
+    if not options:
+        return None
+    from watermark import POSITIONS, quantize_options
+
+    unknown = set(options) - set(WATERMARK_OPTION_TYPES)
+    if unknown:
+        raise Exception(f"Opciones de marca de agua desconocidas: {', '.join(sorted(unknown))}")
+    if options.get('position', 'bottom-right') not in POSITIONS:
+        raise Exception(f"Posición no válida. Opciones: {', '.join(POSITIONS)}")
+
+    parsed = {}
+    for name, value in options.items():
+        kind = WATERMARK_OPTION_TYPES[name]
+        try:
+            # bool("false") es True: los booleanos se interpretan aparte
+            parsed[name] = parse_bool(value) if kind is bool else kind(value)
+        except (TypeError, ValueError):
+            raise Exception(f"Valor no válido para {name}: {value!r}")
+        if name in WATERMARK_OPTION_RANGES:
+            low, high = WATERMARK_OPTION_RANGES[name]
+            # La comparación también descarta NaN
+            if not low <= parsed[name] <= high:
+                raise Exception(f"{name} debe estar entre {low} y {high}.")
+    # Misma cuantización que la caché de marcas de agua, así las opciones casi iguales comparten resultado
+    return quantize_options(parsed)
+
+
+def parse_bool(value):
+    """Interpreta true/false, 1/0, yes/no y on/off (en JSON o como texto); lanza ValueError con otro valor."""
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("true", "1", "yes", "on"):
+        return True
+    if text in ("false", "0", "no", "off"):
+        return False
+    raise ValueError(value)
+
+
+def run_generation(payload):
+    """Genera la imagen, le añade el logo y la sube a Firebase; devuelve el resultado o lanza una excepción."""
+    prompt = payload.get('prompt')  # El prompt que viene del usuario
+    logo_name = payload.get('logo', 'default')  # Variante de logo (opcional)
+    variation = int(payload.get('variation', 0))  # Índice de variación del mismo prompt (lotes)
+    watermark = payload.get('watermark', True)  # Sin logo, la imagen se copia en streaming
+    want_derivatives = payload.get('derivatives', DERIVATIVES_ENABLED)  # Miniatura, mediano y completo
+    output_format = negotiate_format(requested=payload.get('format'))  # png, webp o jpeg
+    watermark_options = parse_watermark_options(payload.get('watermark_options'))
+    url_root = payload.get('url_root')  # URL raíz de la petición que encargó la imagen (para local_url)
+    cache_variant = (logo_name if watermark else "sin-logo", "derivados" if want_derivatives else "",
+                     output_format if watermark else "",
+                     json.dumps(watermark_options, sort_keys=True) if watermark and watermark_options else "")
+    if variation:
+        cache_variant += (variation,)
+
+    # Verificamos que el prompt no esté vacío
+    if not prompt:
+        raise Exception("Se necesita un prompt para generar la imagen.")
+    if logo_name not in LOGOS:
+        raise Exception(f"Logo desconocido: {logo_name}")
+
+    # 0. Si el mismo prompt ya se generó, devolver el resultado guardado
+    cached = cached_result(prompt, cache_variant, url_root)
+    if cached:
+        return cached
+
+    # 1. Generar la imagen basada en el prompt y obtener el revised_prompt
+    revised_prompt, image_url = generate_image(prompt, variation)
+    if not image_url:
+        raise Exception("Error al generar la imagen.")
+
+    # Sin logo: copiar la imagen de DALL·E a Firebase en streaming, sin decodificarla
+    if not watermark:
+        firebase_path = f"generated_images/original/{hashlib.sha256(image_url.split('?')[0].encode()).hexdigest()}.png"
+        firebase_url = stream_to_firebase(image_url, firebase_path)
+        if not firebase_url:
+            raise Exception("Error al subir la imagen a Firebase.")
+        cache_result(prompt, cache_variant, revised_prompt, firebase_path)
+        return {"revised_prompt": revised_prompt, "image_url": image_url, "firebase_url": firebase_url}
+
+    # 2. Añadir el logo a la imagen generada (en memoria)
+    image_with_logo = add_logo_to_image(image_url, LOGOS[logo_name], output_path=DEBUG_IMAGE_PATH,
+                                        output_format=output_format, watermark_options=watermark_options)
+    if not image_with_logo:
+        raise Exception("Error al añadir el logo a la imagen.")
+
+    # 3. Derivados (resize + codificación en el pool de procesos) mientras se sube el PNG
+    from derivatives import submit_derivatives
+
+    derivatives_future = submit_derivatives(image_with_logo.getvalue()) if want_derivatives else None
+
+    # Nombre del objeto direccionado por contenido (hash de los bytes)
+    firebase_path = content_path(image_with_logo, extension=EXTENSIONS[output_format])
+
+    # 4. Subir la imagen con el logo a Firebase (se omite si ya existe)
+    firebase_url = upload_to_firebase(image_with_logo, firebase_path, skip_if_exists=True,
+                                      content_type=CONTENT_TYPES[output_format])
+    if not firebase_url:
+        raise Exception("Error al subir la imagen con logo a Firebase.")
+
+    result = {
+        "revised_prompt": revised_prompt,  # Descripción detallada de la imagen generada
+        "image_url": image_url,
+        "firebase_url": firebase_url
+    }
+    derivative_paths = {}
+    if derivatives_future:
+        try:
+            derivative_paths = upload_derivatives(derivatives_future.result())
+            result["derivatives"] = {name: image_storage.public_url(path) for name, path in derivative_paths.items()}
+        except Exception as e:
+            print(f"Error al generar los derivados de la imagen: {e}")
+    cache_result(prompt, cache_variant, revised_prompt, firebase_path, derivative_paths)
+    add_upload_status(result, firebase_path, url_root)
+    if DEBUG_IMAGE_PATH:
+        result["image_with_logo_path"] = DEBUG_IMAGE_PATH
+    return result
+
+
+# Máximo de elementos por lote; se generan en los workers de la cola de trabajos (JOB_QUEUE_WORKERS).
+# El lote se encola entero, así que por defecto coincide con el límite de la cola (JOB_QUEUE_MAX_PENDING)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", str(QUEUE_MAX_PENDING)))
+
+
+class BatchTooLarge(Exception):
+    """El lote tiene más elementos de los que se pueden encolar de una vez."""
+
+
+def parse_variations(value, max_items):
+    """Número de variaciones de un elemento del lote; lanza ValueError si no está entre 1 y max_items."""
+    try:
+        variations = int(value)
+    except (TypeError, ValueError):
+        variations = 0
+    if not 1 <= variations <= max_items:
+        raise ValueError(f"variations debe ser un entero entre 1 y {max_items}.")
+    return variations
+
+
+def expand_batch(data, max_items=BATCH_MAX_ITEMS):
+    """Convierte el cuerpo del lote en una lista de trabajos (prompt, logo, variación).
+
+    Los elementos se cuentan antes de construir la lista: si el total supera `max_items` se lanza
+    BatchTooLarge sin haber creado nada. Un elemento o un número de variaciones no válido lanza ValueError.
+    """
+    items = data.get('items') or [{"prompt": prompt} for prompt in data.get('prompts', [])]
+    if not isinstance(items, list):
+        raise ValueError("'items' debe ser una lista.")
+    default_variations = parse_variations(data.get('variations', 1), max_items)
+    default_logo = data.get('logo', 'default')
+    default_watermark = data.get('watermark', True)
+    default_derivatives = data.get('derivatives', DERIVATIVES_ENABLED)
+    default_format = data.get('format')
+    default_watermark_options = data.get('watermark_options')
+
+    counted = []
+    total = 0
+    for item in items:
+        if isinstance(item, str):
+            item = {"prompt": item}
+        if not isinstance(item, dict):
+            raise ValueError("Cada elemento del lote debe ser un prompt o un objeto con 'prompt'.")
+        variations = parse_variations(item.get('variations', default_variations), max_items)
+        total += variations
+        if total > max_items:
+            raise BatchTooLarge(f"El lote supera el máximo de {max_items} imágenes.")
+        counted.append((item, variations))
+
+    jobs = []
+    for item, variations in counted:
+        for variation in range(variations):
+            jobs.append({"prompt": item.get('prompt'), "logo": item.get('logo', default_logo),
+                         "watermark": item.get('watermark', default_watermark),
+                         "derivatives": item.get('derivatives', default_derivatives),
+                         "format": item.get('format', default_format),
+                         "watermark_options": item.get('watermark_options', default_watermark_options),
+                         "variation": variation})
+    return jobs
+
+
+# Cola de trabajos en segundo plano (JOB_QUEUE_BACKEND=memory|sqlite, JOB_QUEUE_WORKERS, JOB_QUEUE_EXECUTOR=thread|process)
+job_queue = build_job_queue(run_generation)
+
+# Métricas que ya llevan las cachés y los clientes, leídas en cada exportación de /metrics
+metrics.callback("cache_requests_total", "Consultas a las cachés por resultado.",
+                 lambda: cache_samples({"result": result_cache.stats(), "logo": logo_cache.stats()}), "counter")
+metrics.callback("openai_requests", "Estado de las llamadas a OpenAI (cola, en vuelo, reintentos, fallos).",
+                 lambda: [({"field": name}, value) for name, value in openai_client.metrics.snapshot().items()])
+if write_behind:
+    metrics.callback("write_behind_uploads",
+                     "Subidas diferidas pendientes, en el spool, completadas, reintentadas y fallidas.",
+                     lambda: [({"field": name}, value) for name, value in write_behind.stats().items()])
+metrics.callback("http_pool_requests", "Peticiones HTTP salientes y conexiones nuevas.",
+                 lambda: [({"field": name}, value) for name, value in pool_stats().items()])
+
+# Calentar en segundo plano: el proceso ya acepta peticiones mientras se cargan Firebase, OpenAI y Pillow
+if os.getenv("STARTUP_WARMUP", "1") == "1":
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
 @app.route('/generate-image-with-logo', methods=['POST'])
 def generate_image_with_logo():
     try:
         # Obtener el prompt desde el cuerpo de la solicitud POST
         data = request.get_json()
-        prompt = data.get('prompt')  # El prompt que viene del usuario
+        # Formato de salida: parámetro "format" o cabecera Accept (image/webp, image/jpeg, image/png)
+        data['format'] = negotiate_format(request.headers.get('Accept'), data.get('format'))
+        data['url_root'] = request.url_root
+        return jsonify(run_generation(data)), 200
 
-        # Verificamos que el prompt no esté vacío
-        if not prompt:
-            raise Exception("Se necesita un prompt para generar la imagen.")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # 1. Generar la imagen basada en el prompt y obtener el revised_prompt
-        revised_prompt, image_url = generate_image(prompt)
-        if not image_url:
-            raise Exception("Error al generar la imagen.")
 
-        # 2. Añadir el logo a la imagen generada
-        image_with_logo_path = add_logo_to_image(image_url)
-        if not image_with_logo_path:
-            raise Exception("Error al añadir el logo a la imagen.")
+@app.route('/generate-images-batch', methods=['POST'])
+def generate_images_batch():
+    """Encola un lote de prompts (y variaciones) y devuelve de inmediato (202) un job_id por elemento."""
+    try:
+        data = request.get_json()
+        data = data or {}
+        data.setdefault('format', negotiate_format(request.headers.get('Accept')))
+        # Un lote mayor que la cola nunca cabría: se rechaza (413) en lugar de pedir que se reintente
+        items = expand_batch(data, min(BATCH_MAX_ITEMS, job_queue.max_pending))
+        if not items:
+            raise ValueError("Se necesita una lista de prompts ('prompts' o 'items').")
+        for item in items:
+            item["url_root"] = request.url_root
+
+        # Cada elemento es un trabajo de la cola: la petición no espera a las llamadas a DALL·E
+        job_ids = job_queue.submit_many(items)
+        return jsonify({
+            "jobs": [{"prompt": item["prompt"], "variation": item["variation"], "job_id": job_id, "status": "queued"}
+                     for item, job_id in zip(items, job_ids)],
+            "queued": len(job_ids)
+        }), 202
+    except BatchTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 
-        # 3. Limpiar el revised_prompt para usarlo como nombre de archivo
-        clean_prompt = clean_filename(revised_prompt)
-        firebase_path = f"generated_images/{clean_prompt}.png"
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Encola una generación y devuelve su job_id de inmediato (202)."""
+    try:
+        data = request.get_json()
+        if not data or not data.get('prompt'):
+            raise Exception("Se necesita un prompt para generar la imagen.")
+        if data.get('logo', 'default') not in LOGOS:
+            raise Exception(f"Logo desconocido: {data.get('logo')}")
+
+        job_id = job_queue.submit({"prompt": data['prompt'], "logo": data.get('logo', 'default'),
+                                   "watermark": data.get('watermark', True),
+                                   "derivatives": data.get('derivatives', DERIVATIVES_ENABLED),
+                                   "format": negotiate_format(request.headers.get('Accept'), data.get('format')),
+                                   "watermark_options": data.get('watermark_options'),
+                                   "url_root": request.url_root})
+        return jsonify({"job_id": job_id, "status": "queued"}), 202
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        # 4. Subir la imagen con el logo a Firebase
-        firebase_url = upload_to_firebase(image_with_logo_path, firebase_path)
-        if not firebase_url:
-            raise Exception("Error al subir la imagen con logo a Firebase.")
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Estado y resultado de un trabajo; con ?wait=N espera hasta N segundos a que termine (long-poll)."""
+    try:
+        try:
+            wait = float(request.args.get('wait', 0))
+            if math.isnan(wait):
+                raise ValueError(wait)
+        except ValueError:
+            return jsonify({"error": "El parámetro wait debe ser un número de segundos."}), 400
+        wait = min(max(wait, 0.0), 60.0)
+        job = job_queue.wait(job_id, wait) if wait > 0 else job_queue.get(job_id)
+        if job is None:
+            return jsonify({"error": "Trabajo no encontrado."}), 404
 
         return jsonify({
-            "revised_prompt": revised_prompt,  # Descripción detallada de la imagen generada
-            "image_url": image_url,
-            "image_with_logo_path": image_with_logo_path,
-            "firebase_url": firebase_url
+            "job_id": job["id"],
+            "status": job["status"],
+            "result": job["result"],
+            "error": job["error"]
         }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
+
+@app.route('/storage/<path:path>', methods=['GET'])
+def serve_storage(path):
+    """Sirve los objetos de los backends local y en memoria (con Firebase, las URLs apuntan a Cloud Storage).
+
+    Con la subida diferida, los objetos que aún están en el spool se sirven desde el disco.
+    """
+    try:
+        found = write_behind.read(path) if write_behind else None
+        if found is None:
+            found = image_storage.read(path)
+        if found is None:
+            return jsonify({"error": "Objeto no encontrado."}), 404
+        data, content_type = found
+        return Response(data, mimetype=content_type, headers={"Cache-Control": "public, max-age=31536000, immutable"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latencia, bytes y errores por etapa, aciertos de caché y estado de OpenAI en formato Prometheus."""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+
+@app.route('/stats/http', methods=['GET'])
+def http_stats():
+    """Estadísticas de reutilización de conexiones HTTP salientes."""
+    return jsonify(pool_stats()), 200
+
+
+@app.route('/stats/write-behind', methods=['GET'])
+def write_behind_stats():
+    """Subidas diferidas pendientes, en el spool, completadas, reintentadas y fallidas."""
+    if not write_behind:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **write_behind.stats()}), 200
+
+
+@app.route('/stats/openai', methods=['GET'])
+def openai_stats():
+    """Profundidad de la cola, peticiones en vuelo y tiempos de espera de las llamadas a OpenAI."""
+    return jsonify(openai_client.metrics.snapshot()), 200
+
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,181 @@
+import asyncio
+import contextlib
+import json
+import os
+import re
+import threading
+from io import BytesIO
+
+import httpx
+import openai
+from PIL import Image
+from logo_cache import logo_cache, logo_size_for
+from image_encoder import encode_image
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+# Versión asíncrona (ASGI) del endpoint /generate-image-with-logo de app.py.
+# Se sirve con: uvicorn async_app:app --workers 1
+# Las llamadas a OpenAI, la descarga de la imagen y la subida al almacenamiento
+# son corrutinas, así que un solo proceso mantiene cientos de generaciones en vuelo.
+
+openai.api_key = os.getenv("OPENAI_API_KEY")
+
+# Límite de generaciones simultáneas por proceso
+MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "500"))
+# Si se define, las imágenes se suben con un PUT HTTP a esta URL en lugar de a Firebase
+STORAGE_UPLOAD_URL = os.getenv("STORAGE_UPLOAD_URL")
+FIREBASE_BUCKET = 'artmind-9f80a.appspot.com'
+
+http_client = None
+in_flight = None
+firebase_ready = False
+firebase_lock = threading.Lock()  # init_firebase se llama desde varios hilos (asyncio.to_thread)
+
+
+def init_firebase():
+    """Inicializa Firebase Admin SDK la primera vez que se necesita."""
+    global firebase_ready
+    if firebase_ready:
+        return
+    import firebase_admin
+    from firebase_admin import credentials
+
+    with firebase_lock:
+        if not firebase_admin._apps:
+            firebase_cred = json.loads(os.getenv("FIREBASE_ADMIN_SDK"))
+            cred = credentials.Certificate(firebase_cred)
+            firebase_admin.initialize_app(cred, {'storageBucket': FIREBASE_BUCKET})
+        firebase_ready = True
+
+
+def clean_filename(text):
+    """Limpia el texto para que sea un nombre de archivo válido."""
+    return re.sub(r'[^A-Za-z0-9]+', '_', text)
+
+
+async def generate_image(prompt):
+    """Genera una imagen con DALL·E sin bloquear el event loop."""
+    try:
+        response = await openai.Image.acreate(
+            model="dall-e-3",
+            prompt=prompt,
+            size="1024x1024",
+            n=1
+        )
+        revised_prompt = response['data'][0].get('revised_prompt', prompt)
+        image_url = response['data'][0]['url']
+        return revised_prompt, image_url
+    except Exception as e:
+        print(f"Error al generar la imagen: {e}")
+        return None, None
+
+
+async def download_image(image_url):
+    """Descarga la imagen generada y devuelve sus bytes."""
+    try:
+        response = await http_client.get(image_url)
+        response.raise_for_status()
+        return response.content
+    except Exception as e:
+        print(f"Error al descargar la imagen: {e}")
+        return None
+
+
+def composite_logo(image_bytes, logo_path="logo.png"):
+    """Superpone el logo sobre la imagen y devuelve el PNG resultante en bytes."""
+    with Image.open(BytesIO(image_bytes)) as image:
+        logo_cache.paste(image, logo_path, logo_size_for(image.size))
+        return encode_image(image, "png").getvalue()
+
+
+def upload_to_firebase(data, destination_blob_name):
+    """Sube los bytes a Firebase Storage y retorna la URL pública (bloqueante)."""
+    from firebase_admin import storage
+
+    init_firebase()
+    blob = storage.bucket().blob(destination_blob_name)
+    blob.upload_from_string(data, content_type="image/png")
+    blob.make_public()
+    return blob.public_url
+
+
+async def upload_image(data, destination_blob_name):
+    """Sube la imagen sin bloquear el event loop y retorna la URL pública."""
+    try:
+        if STORAGE_UPLOAD_URL:
+            url = f"{STORAGE_UPLOAD_URL.rstrip('/')}/{destination_blob_name}"
+            response = await http_client.put(url, content=data, headers={"Content-Type": "image/png"})
+            response.raise_for_status()
+            return url
+        # El SDK de Firebase es síncrono: se ejecuta en un hilo aparte
+        return await asyncio.to_thread(upload_to_firebase, data, destination_blob_name)
+    except Exception as e:
+        print(f"Error al subir la imagen: {e}")
+        return None
+
+
+async def generate_image_with_logo(request):
+    try:
+        data = await request.json()
+        prompt = data.get('prompt')
+        if not prompt:
+            raise Exception("Se necesita un prompt para generar la imagen.")
+
+        async with in_flight:
+            # 1. Generar la imagen basada en el prompt
+            revised_prompt, image_url = await generate_image(prompt)
+            if not image_url:
+                raise Exception("Error al generar la imagen.")
+
+            # 2. Descargar la imagen y añadirle el logo (Pillow corre en un hilo)
+            image_bytes = await download_image(image_url)
+            if not image_bytes:
+                raise Exception("Error al descargar la imagen.")
+            try:
+                image_with_logo = await asyncio.to_thread(composite_logo, image_bytes)
+            except Exception as e:
+                print(f"Error al añadir el logo a la imagen: {e}")
+                raise Exception("Error al añadir el logo a la imagen.")
+
+            # 3. Subir la imagen con el logo
+            firebase_path = f"generated_images/{clean_filename(revised_prompt)}.png"
+            firebase_url = await upload_image(image_with_logo, firebase_path)
+            if not firebase_url:
+                raise Exception("Error al subir la imagen con logo a Firebase.")
+
+        return JSONResponse({
+            "revised_prompt": revised_prompt,
+            "image_url": image_url,
+            "firebase_url": firebase_url
+        }, status_code=200)
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Crea el cliente HTTP compartido al arrancar y lo cierra al apagar."""
+    global http_client, in_flight
+    limits = httpx.Limits(max_connections=MAX_IN_FLIGHT, max_keepalive_connections=100)
+    http_client = httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(60.0))
+    in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+    logo_cache.preload(["logo.png"], [logo_size_for((1024, 1024))])
+    yield
+    await http_client.aclose()
+
+
+app = Starlette(
+    routes=[Route('/generate-image-with-logo', generate_image_with_logo, methods=['POST'])],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
@@ -0,0 +1,141 @@
+"""Benchmark de carga para async_app.py contra servidores locales que imitan a OpenAI y al almacenamiento.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/bench_async_app.py --requests 500 --concurrency 200 --latency 2.0
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_IMAGE = os.path.join(ROOT, "image_with_logo.png")
+
+
+def free_port():
+    """Devuelve un puerto TCP libre en localhost."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def build_stub_app(base_url, latency, jitter):
+    """Servidor que imita /v1/images/generations, la CDN de imágenes y el bucket de almacenamiento."""
+    with open(SAMPLE_IMAGE, "rb") as f:
+        sample_png = f.read()
+    uploads = {"count": 0, "bytes": 0}
+
+    async def images_generations(request):
+        body = await request.json()
+        await asyncio.sleep(max(0.0, random.gauss(latency, jitter)))
+        return JSONResponse({"created": int(time.time()), "data": [{
+            "url": f"{base_url}/cdn/sample.png",
+            "revised_prompt": body.get("prompt", ""),
+        }]})
+
+    async def cdn_image(request):
+        return Response(sample_png, media_type="image/png")
+
+    async def storage_put(request):
+        data = await request.body()
+        uploads["count"] += 1
+        uploads["bytes"] += len(data)
+        return JSONResponse({"name": request.path_params["path"]})
+
+    app = Starlette(routes=[
+        Route("/v1/images/generations", images_generations, methods=["POST"]),
+        Route("/cdn/sample.png", cdn_image),
+        Route("/storage/{path:path}", storage_put, methods=["PUT"]),
+    ])
+    return app, uploads
+
+
+def serve_in_thread(app, port):
+    """Arranca uvicorn en un hilo y espera a que acepte conexiones."""
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_load(url, total, concurrency):
+    """Lanza `total` peticiones con como mucho `concurrency` en vuelo y devuelve las latencias."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(300.0)) as client:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(url, json={"prompt": f"Un gato bajo la lluvia #{i}"})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=1.0, help="Latencia media simulada de DALL·E (s)")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    args = parser.parse_args()
+
+    stub_port, app_port = free_port(), free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    stub_app, uploads = build_stub_app(stub_url, args.latency, args.jitter)
+    serve_in_thread(stub_app, stub_port)
+
+    # async_app lee la configuración al importarse y abre logo.png relativo al cwd
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    os.environ["OPENAI_API_KEY"] = "sk-benchmark"
+    os.environ["STORAGE_UPLOAD_URL"] = f"{stub_url}/storage"
+    import openai
+    import async_app
+    openai.api_base = f"{stub_url}/v1"
+    serve_in_thread(async_app.app, app_port)
+
+    url = f"http://127.0.0.1:{app_port}/generate-image-with-logo"
+    latencies, errors, elapsed = asyncio.run(run_load(url, args.requests, args.concurrency))
+
+    print(f"peticiones:      {args.requests} (concurrencia {args.concurrency}, errores {errors})")
+    print(f"tiempo total:    {elapsed:.2f} s")
+    print(f"throughput:      {args.requests / elapsed:.1f} req/s")
+    print(f"latencia media:  {statistics.mean(latencies):.3f} s")
+    print(f"latencia p50:    {percentile(latencies, 50):.3f} s")
+    print(f"latencia p95:    {percentile(latencies, 95):.3f} s")
+    print(f"subidas:         {uploads['count']} ({uploads['bytes'] / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""Benchmark de extremo a extremo de app.py sin conexión: OpenAI simulado, almacenamiento local y un log de peticiones.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/bench_e2e.py --log requests.jsonl --requests 200 --concurrency 16 \\
+        --latency "images=lognormal:1.5:0.3,audio=normal:0.8:0.1,chat=fixed:0.3"
+
+La app corre en un proceso aparte (servidor WSGI con hilos) para medir su CPU y su memoria pico.
+Cada ejecución se añade a --output junto con el commit actual, y se compara con la anterior.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from bench_async_app import free_port, percentile, serve_in_thread
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_LATENCY = "images=lognormal:1.5:0.3,audio=normal:0.8:0.1,chat=fixed:0.3"
+# Parámetros que deben coincidir para comparar dos ejecuciones
+COMPARABLE_KEYS = ("log", "requests", "concurrency", "latency", "storage", "result_cache")
+
+
+def parse_latency(spec):
+    """Convierte "images=lognormal:1.5:0.3,chat=fixed:0.3" en {endpoint: función que devuelve segundos}.
+
+    Distribuciones: fixed:s, normal:media:desviación, lognormal:mediana:sigma, uniform:mín:máx.
+    """
+    samplers = {}
+    for item in spec.split(","):
+        name, _, definition = item.partition("=")
+        kind, *params = definition.split(":")
+        params = [float(value) for value in params]
+        if kind == "fixed":
+            samplers[name] = lambda s=params[0]: s
+        elif kind == "normal":
+            samplers[name] = lambda m=params[0], d=params[1]: max(0.0, random.gauss(m, d))
+        elif kind == "lognormal":
+            samplers[name] = lambda m=params[0], s=params[1]: m * random.lognormvariate(0, s)
+        elif kind == "uniform":
+            samplers[name] = lambda a=params[0], b=params[1]: random.uniform(a, b)
+        else:
+            raise ValueError(f"Distribución no válida: {kind}")
+    return samplers
+
+
+def build_mock_openai(base_url, latency, images):
+    """Servidor que imita los endpoints de imágenes, audio y chat de OpenAI y la CDN de las imágenes."""
+    pngs = []
+    for path in images:
+        with open(path, "rb") as file:
+            pngs.append(file.read())
+    counter = itertools.count()
+
+    async def wait(endpoint):
+        await asyncio.sleep(latency.get(endpoint, lambda: 0.0)())
+
+    async def images_generations(request):
+        body = await request.json()
+        await wait("images")
+        return JSONResponse({"created": int(time.time()), "data": [{
+            "url": f"{base_url}/cdn/{next(counter) % len(pngs)}.png",
+            "revised_prompt": body.get("prompt", ""),
+        }]})
+
+    async def audio_transcriptions(request):
+        await request.body()
+        await wait("audio")
+        return JSONResponse({"text": "un perro en patineta"})
+
+    async def chat_completions(request):
+        await request.json()
+        await wait("chat")
+        return JSONResponse({"id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+                             "model": "gpt-3.5-turbo", "choices": [{
+                                 "index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "a dog on a skateboard"}}]})
+
+    async def cdn_image(request):
+        return Response(pngs[int(request.path_params["index"]) % len(pngs)], media_type="image/png")
+
+    return Starlette(routes=[
+        Route("/v1/images/generations", images_generations, methods=["POST"]),
+        Route("/v1/audio/transcriptions", audio_transcriptions, methods=["POST"]),
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/cdn/{index:int}.png", cdn_image),
+    ])
+
+
+def load_request_log(path, total):
+    """Lee el log (JSONL) y lo repite hasta `total` peticiones: [(método, ruta, cuerpo JSON)].
+
+    Cada línea puede ser {"method", "path", "json"} o una entrada con "prompt" (o "title", como
+    requests.jsonl), que se envía a /generate-image-with-logo.
+    """
+    entries = []
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "path" in entry:
+                entries.append((entry.get("method", "POST"), entry["path"], entry.get("json")))
+            else:
+                prompt = entry.get("prompt") or entry.get("title") or entry.get("body", "")
+                entries.append(("POST", "/generate-image-with-logo", {"prompt": prompt}))
+    if not entries:
+        sys.exit(f"El log {path} está vacío.")
+    return [entries[i % len(entries)] for i in range(total)]
+
+
+async def replay(base_url, requests, concurrency):
+    """Reproduce las peticiones con como mucho `concurrency` en vuelo; devuelve (latencias, errores, segundos)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async with httpx.AsyncClient(base_url=base_url, limits=httpx.Limits(max_connections=concurrency),
+                                 timeout=httpx.Timeout(600.0)) as client:
+        async def one(method, path, body):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(*request) for request in requests))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def process_usage(pid):
+    """(segundos de CPU, RSS pico en MB) de un proceso vivo, leídos de /proc (Linux); None si no hay /proc."""
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        with open(f"/proc/{pid}/status") as file:
+            peak_kb = next(int(line.split()[1]) for line in file if line.startswith("VmHWM:"))
+        return cpu, peak_kb / 1024
+    except (OSError, StopIteration):
+        return None
+
+
+def start_app(port, env):
+    """Arranca app.py en un proceso aparte y espera a que responda.
+
+    La app va en su propio grupo de procesos, así stop_app() termina también los workers de sus pools.
+    """
+    code = ("import app\nfrom werkzeug.serving import make_server\n"
+            f"make_server('127.0.0.1', {port}, app.app, threaded=True).serve_forever()")
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, env=env, start_new_session=True)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats/http", timeout=1)
+            return process
+        except httpx.HTTPError:
+            if process.poll() is not None:
+                stop_app(process)
+                sys.exit("La app terminó al arrancar.")
+            time.sleep(0.2)
+    stop_app(process)
+    sys.exit("La app no arrancó a tiempo.")
+
+
+def stop_app(process, timeout=10):
+    """Termina la app y todo su grupo de procesos: SIGTERM y, después, SIGKILL a lo que quede."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        pass
+    try:
+        os.killpg(process.pid, signal.SIGKILL)  # Workers de los pools que sigan vivos
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log", default=os.path.join(ROOT, "requests.jsonl"))
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", default=DEFAULT_LATENCY)
+    parser.add_argument("--images", nargs="+", default=[os.path.join(ROOT, "image_with_logo.png")],
+                        help="PNG que devuelve la CDN simulada (se reparten en rotación)")
+    parser.add_argument("--storage", choices=["local", "memory"], default="local")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="Dejar activa la caché de resultados (por defecto se desactiva para medir el pipeline entero)")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", "e2e.jsonl"))
+    args = parser.parse_args()
+
+    requests = load_request_log(args.log, args.requests)
+    mock_port, app_port = free_port(), free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    serve_in_thread(build_mock_openai(mock_url, parse_latency(args.latency), args.images), mock_port)
+
+    storage_dir = tempfile.mkdtemp(prefix="artmind-bench-")
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="sk-benchmark",
+        OPENAI_API_BASE=f"{mock_url}/v1",
+        OPENAI_RATE_LIMITS="dall-e-3=1000000,whisper-1=1000000,gpt-3.5-turbo=1000000",
+        OPENAI_MAX_IN_FLIGHT=str(max(args.concurrency, 8)),
+        STORAGE_BACKEND=args.storage,
+        STORAGE_LOCAL_DIR=storage_dir,
+        STORAGE_PUBLIC_BASE_URL=f"http://127.0.0.1:{app_port}/storage",
+    )
+    if not args.result_cache:
+        env["RESULT_CACHE_TTL"] = "0"
+    try:
+        process = start_app(app_port, env)
+        try:
+            before = process_usage(process.pid)
+            latencies, errors, elapsed = asyncio.run(replay(f"http://127.0.0.1:{app_port}", requests,
+                                                            args.concurrency))
+            after = process_usage(process.pid)
+        finally:
+            stop_app(process)
+    finally:
+        shutil.rmtree(storage_dir, ignore_errors=True)
+
+    if before and after:
+        cpu_seconds, peak_rss_mb = after[0] - before[0], after[1]
+    else:
+        # Sin /proc: uso acumulado del proceso hijo, arranque incluido (ru_maxrss en KB en Linux, bytes en macOS)
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_seconds = usage.ru_utime + usage.ru_stime
+        peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "log": os.path.basename(args.log),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "latency": args.latency,
+        "storage": args.storage,
+        "result_cache": args.result_cache,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(args.requests / elapsed, 2),
+        "p50_s": round(percentile(latencies, 50), 4),
+        "p95_s": round(percentile(latencies, 95), 4),
+        "p99_s": round(percentile(latencies, 99), 4),
+        "cpu_s": round(cpu_seconds, 2),
+        "cpu_pct": round(100 * cpu_seconds / elapsed, 1),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+    }
+
+    # Solo se compara con la última ejecución con los mismos parámetros
+    previous = None
+    if os.path.exists(args.output):
+        with open(args.output) as file:
+            for line in file:
+                if line.strip():
+                    run = json.loads(line)
+                    if all(run.get(key) == result[key] for key in COMPARABLE_KEYS):
+                        previous = run
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "a") as file:
+        file.write(json.dumps(result) + "\n")
+
+    if previous is None:
+        print("Sin ejecuciones anteriores con los mismos parámetros.")
+    else:
+        print(f"Comparado con {previous['timestamp']} (commit {previous['commit']})")
+    print(f"{'métrica':<14} {'actual':>10} {'anterior':>10}")
+    for key in ("errors", "rps", "p50_s", "p95_s", "p99_s", "cpu_pct", "peak_rss_mb"):
+        old = previous.get(key) if previous else None
+        print(f"{key:<14} {result[key]:>10} {'' if old is None else old:>10}")
+    print(f"\nResultado guardado en {args.output} (commit {result['commit']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Micro-benchmark de codificación: tiempo vs. tamaño para cada ajuste sobre la imagen de ejemplo.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/bench_encode.py --image image_with_logo.png --repeat 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from image_encoder import encode_image  # noqa: E402
+
+SETTINGS = [
+    ("png", {"compress_level": 1}),
+    ("png", {"compress_level": 3}),
+    ("png", {"compress_level": 6}),
+    ("png", {"compress_level": 9}),
+    ("png", {"compress_level": 9, "optimize": True}),
+    ("webp", {"lossless": True, "method": 4}),
+    ("webp", {"quality": 95}),
+    ("webp", {"quality": 85}),
+    ("webp", {"quality": 75}),
+    ("jpeg", {"quality": 95}),
+    ("jpeg", {"quality": 88}),
+    ("jpeg", {"quality": 75}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image", default=os.path.join(ROOT, "image_with_logo.png"))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with Image.open(args.image) as image:
+        image.load()
+        print(f"{args.image}: {image.size[0]}x{image.size[1]} {image.mode}, {os.path.getsize(args.image) / 1024:.0f} KB en disco\n")
+        print(f"{'formato':<8} {'ajustes':<40} {'tiempo (ms)':>12} {'tamaño (KB)':>12}")
+        for fmt, settings in SETTINGS:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                buffer = encode_image(image, fmt, **settings)
+                times.append((time.perf_counter() - start) * 1000)
+            size = len(buffer.getvalue()) / 1024
+            label = ", ".join(f"{k}={v}" for k, v in settings.items())
+            print(f"{fmt:<8} {label:<40} {statistics.median(times):>12.1f} {size:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
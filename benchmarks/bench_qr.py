@@ -0,0 +1,81 @@
+"""Benchmark de códigos QR: ruta original de artmind2.py (PNG codificado y reabierto) frente a qr_service.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/bench_qr.py --urls 200 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+import qrcode
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "localAPI"))
+
+from qr_service import QRService  # noqa: E402
+
+
+def original_qrcode(text):
+    """Ruta original: QRCode nuevo, raster a box_size=10, PNG en BytesIO y Image.open."""
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+    qr.add_data(text)
+    qr.make(fit=True)
+    qr_img = qr.make_image(fill_color="black", back_color="white")
+    qr_img_byte = BytesIO()
+    qr_img.save(qr_img_byte, format='PNG')
+    qr_img_byte.seek(0)
+    image = Image.open(qr_img_byte)
+    image.load()
+    return image
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--urls", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # URLs con la forma de las de DALL·E (largas, con firma)
+    urls = [f"https://oaidalleapiprodscus.blob.core.windows.net/private/org-x/img-{i:06d}.png"
+            f"?st=2024-10-01T00%3A00%3A00Z&se=2024-10-01T02%3A00%3A00Z&sig={i * 7919:032x}" for i in range(args.urls)]
+
+    # Las dos rutas dan la misma imagen
+    reference = np.asarray(original_qrcode(urls[0]).convert("L"))
+    assert np.array_equal(reference, np.asarray(QRService().image(urls[0]))), "Las imágenes QR no coinciden"
+
+    # La caché caliente tiene sitio para todas las URLs: cada imagen tiene que salir de la caché
+    cached = QRService(max_entries=len(urls))
+    cached.batch(urls)
+    rows = [
+        ("original: QRCode + PNG + Image.open", lambda: [original_qrcode(url) for url in urls]),
+        ("qr_service.image, caché vacía", lambda: [QRService().image(url) for url in urls]),
+        ("qr_service.matrix, caché vacía", lambda: [QRService().matrix(url) for url in urls]),
+        ("qr_service.svg, caché vacía", lambda: [QRService().svg(url) for url in urls]),
+        ("qr_service.batch (imagen), caché vacía", lambda: QRService().batch(urls)),
+        ("qr_service.image, caché caliente", lambda: [cached.image(url) for url in urls]),
+    ]
+    print(f"{'método':<42} {'ms/QR':>8}")
+    for label, fn in rows:
+        print(f"{label:<42} {timed(fn, args.repeat) / args.urls:>8.3f}")
+    stats = cached.stats()
+    assert stats["misses"] == len(urls) and stats["hits"] == len(urls) * args.repeat, \
+        f"La caché caliente no acertó: {stats}"
+
+
+if __name__ == "__main__":
+    main()
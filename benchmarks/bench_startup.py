@@ -0,0 +1,86 @@
+"""Tiempo de arranque: resumen de `python -X importtime` al importar la app, por paquete.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/bench_startup.py --module app --top 15 --budget-ms 1500
+
+Falla (código 1) si la importación supera --budget-ms o si se carga al importar alguno de los
+módulos pesados de --forbid, que deben cargarse en el primer uso o en warm_up().
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = "openai,firebase_admin,google.cloud.storage,PIL.Image,numpy,scipy"
+
+
+def import_times(module, runs):
+    """Importa `module` en un proceso nuevo con -X importtime; devuelve ({módulo: (propio, acumulado)} en µs, ms de pared)."""
+    best = None
+    for _ in range(runs):
+        env = dict(os.environ, STARTUP_WARMUP="0")  # Medir solo la importación, sin el calentamiento
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                   cwd=ROOT, env=env, capture_output=True, text=True)
+        wall_ms = (time.perf_counter() - start) * 1000
+        if completed.returncode != 0:
+            sys.exit(f"Error al importar {module}:\n{completed.stderr[-2000:]}")
+        times = {}
+        for line in completed.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, cumulative_us, name = (field.strip() for field in line[len("import time:"):].split("|"))
+            times[name.strip()] = (int(self_us), int(cumulative_us))
+        if best is None or wall_ms < best[1]:
+            best = (times, wall_ms)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=3, help="Se queda con la ejecución más rápida")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    parser.add_argument("--forbid", default=HEAVY_MODULES)
+    parser.add_argument("--json", help="Guardar el resumen en este archivo")
+    args = parser.parse_args()
+
+    times, wall_ms = import_times(args.module, args.runs)
+
+    # Tiempo propio sumado por paquete de primer nivel (flask, werkzeug, requests...)
+    by_package = defaultdict(int)
+    for name, (self_us, _) in times.items():
+        by_package[name.split(".")[0]] += self_us
+    ranked = sorted(by_package.items(), key=lambda item: item[1], reverse=True)
+
+    print(f"import {args.module}: {wall_ms:.0f} ms de pared (intérprete incluido), {len(times)} módulos\n")
+    print(f"{'paquete':<28} {'ms':>8}")
+    for package, self_us in ranked[:args.top]:
+        print(f"{package:<28} {self_us / 1000:>8.1f}")
+
+    forbidden = [name for name in args.forbid.split(",") if name and name in times]
+    failures = []
+    if forbidden:
+        failures.append(f"módulos pesados cargados al importar: {', '.join(forbidden)}")
+    if args.budget_ms is not None and wall_ms > args.budget_ms:
+        failures.append(f"{wall_ms:.0f} ms supera el presupuesto de {args.budget_ms:.0f} ms")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"module": args.module, "wall_ms": round(wall_ms, 1),
+                       "packages_ms": {package: self_us / 1000 for package, self_us in ranked},
+                       "forbidden_loaded": forbidden}, file, indent=2)
+
+    if failures:
+        print("\nREGRESIÓN: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark del motor de marca de agua en NumPy frente al paste de Pillow.
+
+Uso (desde la raíz del repositorio):
+
+    python benchmarks/bench_watermark.py --sizes 1024 2048 4096 --repeat 20 --batch 16
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from logo_cache import logo_cache, logo_size_for  # noqa: E402
+from watermark import Watermark  # noqa: E402
+
+LOGO = os.path.join(ROOT, "logo.png")
+
+
+def pillow_original(image):
+    """Ruta original de app.py: abrir el logo, redimensionarlo y pegarlo en cada llamada."""
+    with Image.open(LOGO) as logo:
+        logo.thumbnail((image.width // 5, image.height // 5))
+        image.paste(logo, (image.width - logo.width, image.height - logo.height), logo)
+    return image
+
+
+def pillow_cached(image):
+    """Paste de Pillow con el logo ya decodificado en LogoCache."""
+    logo_cache.paste(image, LOGO, logo_size_for(image.size))
+    return image
+
+
+# Todas las variantes modifican la imagen en el sitio; repetirlas sobre la misma imagen no cambia el coste
+def timed(fn, repeat):
+    fn()  # Calentamiento: carga cachés y capas precalculadas
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image", default=os.path.join(ROOT, "image_with_logo.png"))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048, 4096])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=16)
+    args = parser.parse_args()
+
+    with Image.open(args.image) as source:
+        source = source.convert("RGB")
+
+    print(f"{'tamaño':<11} {'método':<36} {'ms/imagen':>10}")
+    for size in args.sizes:
+        image = source.resize((size, size))
+        corner = Watermark(LOGO)
+        faded = Watermark(LOGO, opacity=0.6, position="bottom-right", margin=16)
+        tiled = Watermark(LOGO, opacity=0.25, tiled=True, angle=30)
+        batch = [image] * args.batch
+        rows = [
+            ("Pillow: abrir + thumbnail + paste", lambda: pillow_original(image)),
+            ("Pillow: logo en caché + paste", lambda: pillow_cached(image)),
+            ("NumPy: esquina, opacidad 1.0", lambda: corner.apply(image)),
+            ("NumPy: esquina, opacidad 0.6", lambda: faded.apply(image)),
+            ("NumPy: mosaico diagonal 0.25", lambda: tiled.apply(image)),
+        ]
+        for label, fn in rows:
+            print(f"{size}x{size:<6} {label:<36} {timed(fn, args.repeat):>10.2f}")
+        per_image = timed(lambda: corner.apply_batch(batch), max(1, args.repeat // 4)) / args.batch
+        print(f"{size}x{size:<6} {f'NumPy: lote de {args.batch}, esquina':<36} {per_image:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
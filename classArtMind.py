@@ -1,25 +1,29 @@
-import openai
-import numpy as np
-from scipy.io.wavfile import write
 import os
 from dotenv import load_dotenv
-from PIL import Image
 from io import BytesIO
-import requests
+from http_pool import get_session
+from language import translate_cached
+from openai_client import openai_client
+from metrics import metrics
+from logo_cache import logo_cache
 
 class ArtMind:
-    def __init__(self, image_output="image_with_logo.png", logo_file="logo.png"):
+    def __init__(self, image_output=None, logo_file="logo.png"):
         # Cargar las variables de entorno desde el archivo .env
+        # (el SDK de OpenAI se importa y configura en la primera llamada, ver openai_client.get_openai)
         self.api_key = os.getenv("OPENAI_API_KEY")
-        openai.api_key = self.api_key
         
         # Parámetros de grabación
         self.fs = 44100  # Frecuencia de muestreo
         self.seconds = 5  # Duración de la grabación
         # self.audio_file = audio_file
+        # Ruta opcional para guardar en disco la imagen con el logo (solo para depuración)
         self.image_output = image_output
         self.logo_file = logo_file
 
+        # Decodificar el logo una sola vez; cada imagen solo paga el paste
+        logo_cache.preload([self.logo_file], [None])
+
         # Solo cargar sounddevice en entornos de desarrollo
         if os.getenv("ENV") == "development":
             try:
@@ -34,6 +38,10 @@ class ArtMind:
             print("Grabación de audio no está disponible en este entorno.")
             return None
 
+        # NumPy y SciPy solo hacen falta para grabar
+        import numpy as np
+        from scipy.io.wavfile import write
+
         try:
             print("Grabando...")
             audio_data = self.sd.rec(int(self.seconds * self.fs), samplerate=self.fs, channels=1, dtype=np.int16)
@@ -45,20 +53,26 @@ class ArtMind:
             print(f"Error al grabar audio: {e}")
             return None
 
+    @metrics.timed("audio_to_text", bytes_arg=1)
     def audio_to_text(self, audio_path):
         """Convierte el audio en texto usando OpenAI."""
         try:
             with open(audio_path, "rb") as audio_file:
-                transcription = openai.Audio.transcribe(model="whisper-1", file=audio_file)
+                transcription = openai_client.transcribe(audio_file, model="whisper-1")
             return transcription['text']
         except Exception as e:
             print(f"Error en la transcripción del audio: {e}")
             return None
 
+    @metrics.timed("translate_text")
     def translate_text(self, text, language="en"):
+        """Traduce el texto al inglés; no llama a OpenAI si ya está en inglés o si ya se tradujo antes."""
+        return translate_cached(text, language, self._translate_with_openai)
+
+    def _translate_with_openai(self, text):
         """Traduce el texto al inglés usando OpenAI."""
         try:
-            response = openai.ChatCompletion.create(
+            response = openai_client.chat(
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": "Eres un traductor experto."},
@@ -70,10 +84,11 @@ class ArtMind:
             print(f"Error en la traducción del texto: {e}")
             return None
 
+    @metrics.timed("generate_image")
     def generate_image(self, prompt):
         """Genera una imagen basada en un prompt usando DALL·E."""
         try:
-            response = openai.Image.create(
+            response = openai_client.create_image(
                 model="dall-e-3",
                 prompt=prompt,
                 size="1024x1024",
@@ -86,29 +101,31 @@ class ArtMind:
             print(f"Error al generar la imagen: {e}")
             return None
 
+    @metrics.timed("add_logo_to_image", bytes_result=True)
     def add_logo_to_image(self, image_url):
-        """Añade un logo a la imagen generada."""
+        """Añade un logo a la imagen generada y la devuelve como PNG en memoria (BytesIO)."""
+        from PIL import Image
+
         try:
             # Descargar la imagen desde la URL
-            response = requests.get(image_url)
+            response = get_session().get(image_url)
             response.raise_for_status()  # Asegura que la solicitud fue exitosa
-            image = Image.open(BytesIO(response.content))
-
-            # Abrir el logo
-            logo = Image.open(self.logo_file)
 
-            # Superponer el logo en la esquina inferior derecha de la imagen
-            image.paste(logo, (image.width - logo.width, image.height - logo.height), logo)
+            with Image.open(BytesIO(response.content)) as image:
+                # Superponer el logo (en caché) en la esquina inferior derecha de la imagen
+                logo_cache.paste(image, self.logo_file)
 
-            # Guardar la imagen con el logo
-            image.save(self.image_output)
+                # Codificar la imagen con el logo directamente en memoria
+                buffer = BytesIO()
+                image.save(buffer, format="PNG")
 
-            # Cerrar los archivos abiertos
-            image.close()
-            logo.close()
+            # Guardar también en disco solo si se pidió (depuración)
+            if self.image_output:
+                with open(self.image_output, "wb") as file:
+                    file.write(buffer.getbuffer())
 
-            return self.image_output
+            buffer.seek(0)
+            return buffer
         except Exception as e:
             print(f"Error al añadir el logo a la imagen: {e}")
             return None
-
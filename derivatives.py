@@ -0,0 +1,113 @@
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+# Derivados por defecto: "nombre:lado_máximo:formato:calidad", separados por comas
+DEFAULT_DERIVATIVES = "thumbnail:256:webp:80,medium:512:webp:85,full:1024:webp:90"
+ENCODE_WORKERS = int(os.getenv("DERIVATIVE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+
+def avif_available():
+    """AVIF solo está disponible si Pillow se compiló con soporte (o con pillow-avif-plugin)."""
+    try:
+        import pillow_avif  # noqa: F401
+    except ImportError:
+        pass
+    return "AVIF" in Image.SAVE
+
+
+def parse_derivatives(value):
+    """Convierte "thumbnail:256:webp:80,..." en una lista de specs (nombre, lado, formato, calidad)."""
+    specs = []
+    for item in (value or DEFAULT_DERIVATIVES).split(","):
+        parts = item.strip().split(":")
+        if len(parts) < 3:
+            continue
+        name, size, fmt = parts[0], int(parts[1]), parts[2].lower()
+        quality = int(parts[3]) if len(parts) > 3 else 85
+        if fmt == "jpg":
+            fmt = "jpeg"
+        if fmt == "avif" and not avif_available():
+            fmt = "webp"  # Sin soporte de AVIF, WebP es el siguiente formato más compacto
+        specs.append((name, size, fmt, quality))
+    return specs
+
+
+DERIVATIVES = parse_derivatives(os.getenv("IMAGE_DERIVATIVES"))
+
+
+def render_derivatives(image_bytes, specs):
+    """Decodifica la imagen una sola vez y codifica cada derivado; devuelve [(nombre, bytes, formato)].
+
+    Se ejecuta en un proceso aparte, así el resize y la codificación no retienen el GIL de los hilos de petición.
+    """
+    results = []
+    with Image.open(BytesIO(image_bytes)) as image:
+        image.load()
+        # Los derivados se generan de mayor a menor, reutilizando el anterior como origen
+        source = image
+        for name, size, fmt, quality in sorted(specs, key=lambda spec: -spec[1]):
+            resized = source.copy()
+            if max(resized.size) > size:
+                resized.thumbnail((size, size), Image.LANCZOS)
+            source = resized
+
+            if fmt == "jpeg" and resized.mode != "RGB":
+                resized = resized.convert("RGB")
+            buffer = BytesIO()
+            if fmt == "png":
+                resized.save(buffer, format="PNG", optimize=True)
+            elif fmt == "webp":
+                resized.save(buffer, format="WEBP", quality=quality, method=4)
+            else:
+                resized.save(buffer, format=fmt.upper(), quality=quality)
+            results.append((name, buffer.getvalue(), fmt))
+    return results
+
+
+_pool = None
+_pool_lock = threading.Lock()
+PARENT_CHECK_SECONDS = 1.0
+
+
+def _exit_with_parent(parent_pid):
+    """Inicializador de los workers: terminan en cuanto el proceso padre deja de existir.
+
+    Si la app muere por SIGTERM (sin pasar por atexit), los workers no quedan huérfanos colgando de PID 1.
+    """
+    def watch():
+        while os.getppid() == parent_pid:
+            time.sleep(PARENT_CHECK_SECONDS)
+        os._exit(0)
+
+    threading.Thread(target=watch, name="parent-watch", daemon=True).start()
+
+
+def shutdown_encode_pool():
+    """Cierra el pool de procesos (se registra con atexit al crearlo)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def get_encode_pool():
+    """Pool de procesos para codificar derivados (se crea la primera vez que se usa)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=ENCODE_WORKERS, initializer=_exit_with_parent,
+                                        initargs=(os.getpid(),))
+            atexit.register(shutdown_encode_pool)
+        return _pool
+
+
+def submit_derivatives(image_bytes, specs=None):
+    """Encola la generación de derivados en el pool de procesos y devuelve el Future."""
+    return get_encode_pool().submit(render_derivatives, image_bytes, specs or DERIVATIVES)
@@ -0,0 +1,126 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+# Configuración del pool de conexiones HTTP compartido (se puede ajustar por variables de entorno)
+POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))  # Hosts distintos en caché
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))  # Conexiones keep-alive por host
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5"))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class PoolStats:
+    """Contadores de peticiones y de conexiones TCP abiertas, para medir la reutilización."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def snapshot(self):
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_ratio": reused / self.requests if self.requests else 0.0,
+            }
+
+
+def _counting_pool(base, stats):
+    """Crea una subclase del pool de urllib3 que cuenta cada conexión nueva."""
+    class CountingPool(base):
+        def _new_conn(self):
+            stats.record_connection()
+            return super()._new_conn()
+
+    return CountingPool
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter con timeout por defecto y estadísticas de reutilización de conexiones."""
+
+    def __init__(self, stats, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs):
+        self.stats = stats
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self.stats),
+            "https": _counting_pool(HTTPSConnectionPool, self.stats),
+        }
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        self.stats.record_request()
+        return super().send(request, **kwargs)
+
+
+def build_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                  retries=RETRIES, backoff_factor=BACKOFF_FACTOR,
+                  timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), stats=None):
+    """Crea una sesión de requests con keep-alive, pool de conexiones, timeouts y reintentos con backoff."""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD", "PUT", "OPTIONS"}),  # POST no es idempotente
+        respect_retry_after_header=True,
+    )
+    adapter = PooledAdapter(
+        stats or PoolStats(),
+        timeout=timeout,
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.stats = adapter.stats
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Devuelve la sesión HTTP compartida por todo el proceso (se crea la primera vez)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def pool_stats():
+    """Estadísticas de reutilización de conexiones de la sesión compartida."""
+    return get_session().stats.snapshot()
+
+
+def use_for_openai():
+    """Hace que el SDK de OpenAI (0.28) use la sesión compartida para sus llamadas."""
+    import openai
+
+    openai.requestssession = get_session()
@@ -0,0 +1,62 @@
+import os
+from io import BytesIO
+
+# Formato de salida por defecto y ajustes de cada codificador (variables de entorno)
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "png")
+ENCODER_SETTINGS = {
+    "png": {"compress_level": int(os.getenv("PNG_COMPRESS_LEVEL", "3")),
+            "optimize": os.getenv("PNG_OPTIMIZE", "0") == "1"},
+    "webp": {"quality": int(os.getenv("WEBP_QUALITY", "85")), "method": int(os.getenv("WEBP_METHOD", "4")),
+             "lossless": os.getenv("WEBP_LOSSLESS", "0") == "1"},
+    "jpeg": {"quality": int(os.getenv("JPEG_QUALITY", "88")), "optimize": True, "progressive": True},
+}
+CONTENT_TYPES = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg", "avif": "image/avif"}
+EXTENSIONS = {"png": "png", "webp": "webp", "jpeg": "jpg", "avif": "avif"}
+ALIASES = {"jpg": "jpeg", "image/png": "png", "image/webp": "webp", "image/jpeg": "jpeg", "image/jpg": "jpeg"}
+
+
+def normalize_format(fmt):
+    """Devuelve el nombre canónico del formato ("png", "webp", "jpeg") o None si no se soporta."""
+    if not fmt:
+        return None
+    fmt = ALIASES.get(fmt.strip().lower(), fmt.strip().lower())
+    return fmt if fmt in ENCODER_SETTINGS else None
+
+
+def negotiate_format(accept_header=None, requested=None):
+    """Elige el formato de salida: primero el parámetro explícito, luego la cabecera Accept, y si no el de por defecto."""
+    fmt = normalize_format(requested)
+    if fmt:
+        return fmt
+
+    candidates = []
+    for position, part in enumerate((accept_header or "").split(",")):
+        fields = part.strip().split(";")
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        fmt = normalize_format(fields[0])
+        if fmt and q > 0:
+            # Con la misma q gana el que aparece antes en la cabecera
+            candidates.append((-q, position, fmt))
+    if candidates:
+        return min(candidates)[2]
+    return normalize_format(OUTPUT_FORMAT) or "png"
+
+
+def encode_image(image, fmt=None, **overrides):
+    """Codifica una imagen de Pillow en memoria con los ajustes del formato; devuelve un BytesIO al inicio."""
+    fmt = normalize_format(fmt) or normalize_format(OUTPUT_FORMAT) or "png"
+    settings = {**ENCODER_SETTINGS[fmt], **overrides}
+    if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    buffer = BytesIO()
+    image.save(buffer, format=fmt.upper(), **settings)
+    buffer.seek(0)
+    return buffer
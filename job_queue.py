@@ -0,0 +1,290 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+# Configuración de la cola de trabajos (variables de entorno)
+QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "memory")  # "memory" o "sqlite"
+QUEUE_SQLITE_PATH = os.getenv("JOB_QUEUE_PATH", "job_queue.sqlite3")
+QUEUE_WORKERS = int(os.getenv("JOB_QUEUE_WORKERS", "4"))
+QUEUE_MAX_PENDING = int(os.getenv("JOB_QUEUE_MAX_PENDING", "100"))
+QUEUE_EXECUTOR = os.getenv("JOB_QUEUE_EXECUTOR", "thread")  # "thread" o "process"
+QUEUE_RESULT_TTL = float(os.getenv("JOB_QUEUE_RESULT_TTL", "86400"))
+# sqlite: un trabajo en ejecución pertenece a su proceso mientras este renueve la concesión;
+# si el proceso muere, otro lo retoma cuando la concesión caduca
+QUEUE_LEASE_SECONDS = float(os.getenv("JOB_QUEUE_LEASE_SECONDS", "60"))
+# El long-poll relee el estado con esta frecuencia (los trabajos pueden terminar en otro proceso)
+QUEUE_WAIT_POLL_SECONDS = 0.5
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFull(Exception):
+    """La cola alcanzó su límite de trabajos pendientes."""
+
+
+class MemoryQueueBackend:
+    """Cola en memoria del proceso: rápida, pero los trabajos se pierden al reiniciar."""
+
+    def __init__(self, result_ttl=QUEUE_RESULT_TTL):
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+
+    def add(self, job_id, payload):
+        with self._lock:
+            now = time.time()
+            self._jobs[job_id] = {"id": job_id, "status": QUEUED, "payload": payload,
+                                  "result": None, "error": None, "created_at": now, "updated_at": now}
+        self._pending.put(job_id)
+
+    def take(self, timeout):
+        """Saca el siguiente trabajo pendiente y lo marca como en ejecución (o None si no hay)."""
+        try:
+            job_id = self._pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job["status"], job["updated_at"] = RUNNING, time.time()
+            return job_id, job["payload"]
+
+    def finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            now = time.time()
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(status=status, result=result, error=error, updated_at=now)
+            expired = [k for k, j in self._jobs.items()
+                       if j["status"] in (DONE, FAILED) and j["updated_at"] + self.result_ttl < now]
+            for k in expired:
+                del self._jobs[k]
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def pending_count(self):
+        return self._pending.qsize()
+
+
+class SQLiteQueueBackend:
+    """Cola persistente en sqlite, compartida por los procesos de la app (p. ej. workers de gunicorn).
+
+    Cada trabajo en ejecución guarda su dueño y una concesión (lease_until) que el dueño renueva
+    desde un hilo mientras lo ejecuta. Un trabajo cuyo proceso murió se retoma cuando su concesión
+    caduca; los que siguen en marcha en otro proceso no se tocan.
+    """
+
+    def __init__(self, path=QUEUE_SQLITE_PATH, result_ttl=QUEUE_RESULT_TTL, lease_seconds=QUEUE_LEASE_SECONDS):
+        self.path = path
+        self.result_ttl = result_ttl
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex  # Identifica a esta instancia (proceso) como dueña de sus trabajos
+        self._local = threading.local()
+        self._available = threading.Condition()
+        self._running = set()  # Trabajos de esta instancia cuya concesión hay que renovar
+        self._running_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, result TEXT, error TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, owner TEXT, lease_until REAL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:  # Bases creadas antes de las concesiones
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        threading.Thread(target=self._heartbeat, name="job-lease-heartbeat", daemon=True).start()
+
+    def _heartbeat(self):
+        """Renueva la concesión de los trabajos en ejecución de esta instancia."""
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            with self._running_lock:
+                running = list(self._running)
+            if not running:
+                continue
+            try:
+                with self._connect() as conn:
+                    conn.executemany(
+                        "UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ? AND status = ?",
+                        [(time.time() + self.lease_seconds, job_id, self.owner, RUNNING) for job_id in running],
+                    )
+            except Exception as e:
+                print(f"Error al renovar las concesiones de la cola: {e}")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, job_id, payload):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(payload), now, now),
+            )
+        with self._available:
+            self._available.notify()
+
+    def take(self, timeout):
+        conn = self._connect()
+        deadline = time.time() + timeout
+        while True:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                now = time.time()
+                # Pendientes, o en ejecución con la concesión caducada (su proceso murió)
+                row = conn.execute(
+                    "SELECT id, payload FROM jobs WHERE status = ? "
+                    "OR (status = ? AND (lease_until IS NULL OR lease_until < ?)) ORDER BY created_at LIMIT 1",
+                    (QUEUED, RUNNING, now),
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE jobs SET status = ?, updated_at = ?, owner = ?, lease_until = ? WHERE id = ?",
+                                 (RUNNING, now, self.owner, now + self.lease_seconds, row[0]))
+                    with self._running_lock:
+                        self._running.add(row[0])
+                    return row[0], json.loads(row[1])
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            with self._available:
+                self._available.wait(remaining)
+
+    def finish(self, job_id, status, result=None, error=None):
+        with self._running_lock:
+            self._running.discard(job_id)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, now, job_id),
+            )
+            conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                         (DONE, FAILED, now - self.result_ttl))
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            "SELECT id, status, payload, result, error, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "status": row[1], "payload": json.loads(row[2]),
+                "result": json.loads(row[3]) if row[3] else None, "error": row[4],
+                "created_at": row[5], "updated_at": row[6]}
+
+    def pending_count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+
+
+class JobQueue:
+    """Cola de trabajos con un pool acotado de workers y backpressure cuando está llena.
+
+    `handler(payload)` devuelve un dict con el resultado o lanza una excepción. Con
+    executor="process" el handler corre en un ProcessPoolExecutor (debe ser una función
+    de módulo, serializable con pickle).
+    """
+
+    def __init__(self, handler, backend, workers=QUEUE_WORKERS, max_pending=QUEUE_MAX_PENDING,
+                 executor=QUEUE_EXECUTOR):
+        self.handler = handler
+        self.backend = backend
+        self.workers = workers
+        self.max_pending = max_pending
+        self._process_pool = ProcessPoolExecutor(max_workers=workers) if executor == "process" else None
+        self._finished = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._submit_lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        if self._process_pool:
+            self._process_pool.shutdown()
+
+    def submit(self, payload):
+        """Encola un trabajo y devuelve su ID; lanza QueueFull si hay demasiados pendientes."""
+        with self._submit_lock:
+            if self.backend.pending_count() >= self.max_pending:
+                raise QueueFull("La cola de generación está llena, inténtalo más tarde.")
+            job_id = uuid.uuid4().hex
+            self.backend.add(job_id, payload)
+        return job_id
+
+    def submit_many(self, payloads):
+        """Encola varios trabajos de una vez (todos o ninguno) y devuelve sus IDs en el mismo orden."""
+        with self._submit_lock:
+            if self.backend.pending_count() + len(payloads) > self.max_pending:
+                raise QueueFull("La cola de generación no tiene sitio para el lote, inténtalo más tarde.")
+            job_ids = []
+            for payload in payloads:
+                job_id = uuid.uuid4().hex
+                self.backend.add(job_id, payload)
+                job_ids.append(job_id)
+        return job_ids
+
+    def get(self, job_id):
+        return self.backend.get(job_id)
+
+    def wait(self, job_id, timeout):
+        """Long-poll: espera hasta `timeout` segundos a que el trabajo termine y devuelve su estado.
+
+        Los workers de este proceso avisan al terminar; el estado se relee además cada
+        QUEUE_WAIT_POLL_SECONDS porque con sqlite el trabajo puede terminar en otro proceso.
+        """
+        deadline = time.time() + timeout
+        with self._finished:
+            while True:
+                job = self.backend.get(job_id)
+                remaining = deadline - time.time()
+                if job is None or job["status"] in (DONE, FAILED) or remaining <= 0:
+                    return job
+                self._finished.wait(min(remaining, QUEUE_WAIT_POLL_SECONDS))
+
+    def _worker(self):
+        while not self._stop.is_set():
+            taken = self.backend.take(timeout=1.0)
+            if taken is None:
+                continue
+            job_id, payload = taken
+            try:
+                if self._process_pool:
+                    result = self._process_pool.submit(self.handler, payload).result()
+                else:
+                    result = self.handler(payload)
+                self.backend.finish(job_id, DONE, result=result)
+            except Exception as e:
+                print(f"Error en el trabajo {job_id}: {e}")
+                self.backend.finish(job_id, FAILED, error=str(e))
+            with self._finished:
+                self._finished.notify_all()
+
+
+def build_job_queue(handler, backend=QUEUE_BACKEND, **kwargs):
+    """Crea la cola con el backend configurado ("memory" o "sqlite") y arranca sus workers."""
+    store = SQLiteQueueBackend() if backend == "sqlite" else MemoryQueueBackend()
+    return JobQueue(handler, store, **kwargs).start()
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Palabras muy frecuentes por idioma: bastan unas pocas coincidencias para distinguirlos
+STOPWORDS = {
+    "en": {"the", "a", "an", "and", "of", "to", "in", "on", "with", "is", "are", "it", "that",
+           "this", "for", "at", "by", "from", "under", "over", "my", "his", "her", "its", "their",
+           "playing", "riding", "wearing", "sitting", "standing", "some", "be", "was"},
+    "es": {"el", "la", "los", "las", "un", "una", "unos", "unas", "y", "de", "del", "que", "en",
+           "con", "por", "para", "es", "son", "al", "bajo", "sobre", "mi", "su", "sus", "lo",
+           "se", "muy", "como", "está", "están", "encima", "entre"},
+    "fr": {"le", "la", "les", "un", "une", "des", "et", "de", "du", "que", "dans", "avec",
+           "pour", "est", "sont", "sur", "sous", "au", "aux", "ce", "cette"},
+    "pt": {"o", "a", "os", "as", "um", "uma", "e", "de", "do", "da", "que", "em", "com",
+           "para", "é", "são", "no", "na", "sob", "sobre"},
+}
+# Caracteres que no aparecen en inglés
+NON_ENGLISH_CHARS = re.compile(r"[áéíóúñüàèìòùâêîôûçãõ¿¡]", re.IGNORECASE)
+MIN_MARGIN = 1  # Diferencia mínima de coincidencias para fiarse del resultado
+
+
+def detect_language(text):
+    """Detecta el idioma con un conteo de palabras frecuentes; devuelve None si no hay certeza."""
+    words = re.findall(r"[^\W\d_]+", text.lower())
+    if not words:
+        return None
+    scores = {lang: sum(word in stopwords for word in words) for lang, stopwords in STOPWORDS.items()}
+    if NON_ENGLISH_CHARS.search(text):
+        scores["en"] -= MIN_MARGIN
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    (best, best_score), (_, second_score) = ranked[0], ranked[1]
+    if best_score <= 0 or best_score - second_score < MIN_MARGIN:
+        return None
+    return best
+
+
+class TranslationCache:
+    """Caché LRU de traducciones indexada por (hash del texto, idioma destino), con contadores."""
+
+    def __init__(self, max_entries=int(os.getenv("TRANSLATION_CACHE_SIZE", "1024"))):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0  # El texto ya estaba en el idioma destino
+
+    @staticmethod
+    def key(text, language):
+        return hashlib.sha256(text.strip().encode("utf-8")).hexdigest(), language
+
+    def get(self, text, language):
+        key = self.key(text, language)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, text, language, translation):
+        key = self.key(text, language)
+        with self._lock:
+            self._entries[key] = translation
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bypassed": self.bypassed,
+                    "entries": len(self._entries)}
+
+
+translation_cache = TranslationCache()
+
+
+def translate_cached(text, language, translate_fn):
+    """Traduce `text` con `translate_fn` solo si hace falta.
+
+    Si el texto ya está en `language` se devuelve tal cual; si ya se tradujo antes, sale de la caché.
+    """
+    if detect_language(text) == language:
+        with translation_cache._lock:
+            translation_cache.bypassed += 1
+        return text
+    cached = translation_cache.get(text, language)
+    if cached is not None:
+        return cached
+    translation = translate_fn(text)
+    if translation:
+        translation_cache.set(text, language, translation)
+    return translation
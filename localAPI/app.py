@@ -1,9 +1,22 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from classArtMind import ArtMind
+import json
 import os
+import tempfile
+import threading
+import time
 import firebase_admin
 from firebase_admin import credentials, storage
 import re
+from audio_preprocess import audio_stats
+from audio_stream import IncompleteTranscription
+from job_store import build_job_store, new_job_id
+import shared  # noqa: F401  Módulos comunes de la raíz del repositorio
+from language import translation_cache
+from openai_client import openai_client
+from metrics import CONTENT_TYPE, cache_samples, metrics
+from logo_cache import logo_cache
+from recorder import RECORD_MAX_SECONDS
 
 app = Flask(__name__)
 
@@ -16,37 +29,54 @@ firebase_admin.initialize_app(cred, {
 # Crear una instancia de la clase ArtMind con configuración del logo
 art_mind = ArtMind(logo_file="logo.png")
 
-# Directorio temporal para almacenar los datos intermedios
-TEMP_DIR = "temp_data"
-if not os.path.exists(TEMP_DIR):
-    os.makedirs(TEMP_DIR)
+# Estado de cada trabajo (audio, transcripción, traducción) aislado por job ID
+# JOB_STORE_BACKEND=memory|sqlite|redis
+jobs = build_job_store()
 
-def save_to_file(filename, data):
-    """Guarda datos en un archivo dentro del directorio temporal."""
-    with open(os.path.join(TEMP_DIR, filename), 'w') as file:
-        file.write(data)
+# Directorio para los audios grabados, uno por trabajo
+AUDIO_DIR = os.getenv("AUDIO_DIR", tempfile.gettempdir())
 
-def read_from_file(filename):
-    """Lee datos desde un archivo dentro del directorio temporal."""
-    try:
-        with open(os.path.join(TEMP_DIR, filename), 'r') as file:
-            return file.read()
-    except FileNotFoundError:
-        return None
+# Métricas que ya llevan la caché de traducción, el cliente de OpenAI y el preprocesado de audio
+metrics.callback("cache_requests_total", "Consultas a las cachés por resultado.",
+                 lambda: cache_samples({"translation": translation_cache.stats(), "logo": logo_cache.stats()}), "counter")
+metrics.callback("openai_requests", "Estado de las llamadas a OpenAI (cola, en vuelo, reintentos, fallos).",
+                 lambda: [({"field": name}, value) for name, value in openai_client.metrics.snapshot().items()])
+metrics.callback("audio_bytes_saved_total", "Bytes que el preprocesado de audio ahorró en las subidas a Whisper.",
+                 lambda: [({}, audio_stats.snapshot()["bytes_saved"])], "counter")
+
+def get_job_id(create=False):
+    """Obtiene el job ID de la cabecera X-Job-ID o del parámetro job_id; si se pide, crea uno nuevo."""
+    job_id = request.headers.get("X-Job-ID") or request.args.get("job_id")
+    if not job_id and request.is_json:
+        job_id = (request.get_json(silent=True) or {}).get("job_id")
+    if not job_id and create:
+        job_id = new_job_id()
+    if not job_id:
+        raise Exception("Se necesita un job_id (cabecera X-Job-ID o parámetro job_id).")
+    if not re.fullmatch(r'[A-Za-z0-9_-]{1,64}', job_id):
+        raise Exception("job_id no válido.")
+    return job_id
 
 def clean_filename(text):
     """Limpia el texto para que sea un nombre de archivo válido."""
     # Remueve caracteres no alfanuméricos y reemplaza espacios por guiones bajos
     return re.sub(r'[^A-Za-z0-9]+', '_', text)
 
-def upload_to_firebase(image_path, destination_blob_name):
-    """Sube la imagen a Firebase Storage y retorna la URL."""
+@metrics.timed("upload_to_firebase", bytes_arg=0)
+def upload_to_firebase(image, destination_blob_name):
+    """Sube la imagen a Firebase Storage y retorna la URL.
+
+    `image` puede ser un buffer en memoria (BytesIO) o la ruta de un archivo.
+    """
     try:
         bucket = storage.bucket()  # Obtener el bucket de Firebase
         blob = bucket.blob(destination_blob_name)  # Crear un blob en la ruta de destino
 
-        # Subir el archivo a Firebase Storage
-        blob.upload_from_filename(image_path)
+        # Subir la imagen a Firebase Storage, desde memoria o desde disco
+        if isinstance(image, str):
+            blob.upload_from_filename(image)
+        else:
+            blob.upload_from_file(image, content_type="image/png", rewind=True)
 
         # Hacer que el archivo sea público
         blob.make_public()
@@ -57,18 +87,57 @@ def upload_to_firebase(image_path, destination_blob_name):
         print(f"Error al subir a Firebase: {e}")
         return None
 
-# 1. Endpoint para grabar el audio (POST)
+# Grabaciones en curso de este proceso, por job ID
+recordings = {}
+recordings_lock = threading.Lock()
+RECORD_RESULT_TIMEOUT = float(os.getenv("RECORD_RESULT_TIMEOUT", "60"))
+# Segundos que una grabación terminada espera a /audio-to-text antes de descartarse (el WAV sigue en disco)
+RECORDING_TTL = float(os.getenv("RECORDING_TTL", "300"))
+
+
+def evict_recordings():
+    """Descarta las grabaciones terminadas que nadie recogió y las que no terminaron en el tiempo máximo."""
+    now = time.monotonic()
+    with recordings_lock:
+        expired = [job_id for job_id, recorder in recordings.items()
+                   if (recorder.finished_at is not None and now - recorder.finished_at > RECORDING_TTL)
+                   or (recorder.finished_at is None and now - recorder.started_at > RECORD_MAX_SECONDS + RECORDING_TTL)]
+        evicted = [recordings.pop(job_id) for job_id in expired]
+    for recorder in evicted:
+        recorder.stop()
+    return len(evicted)
+
+
+# 1. Endpoint para empezar a grabar el audio (POST); no bloquea, la grabación termina sola al detectar silencio
 @app.route('/record-audio', methods=['POST'])
 def record_audio():
     try:
-        audio_path = art_mind.record_audio()
-        if not audio_path:
-            raise Exception("Error al grabar el audio.")
+        evict_recordings()
+        job_id = get_job_id(create=True)
+        audio_path = os.path.join(AUDIO_DIR, f"audio_{job_id}.wav")
+        recorder = art_mind.start_recording(audio_path)
+        with recordings_lock:
+            recordings[job_id] = recorder
         
-        # Guardar la ruta del archivo de audio
-        save_to_file("audio_path.txt", audio_path)
+        # Guardar la ruta del archivo de audio (se escribe al terminar la grabación)
+        jobs.set(job_id, "audio_path", audio_path)
         
-        return jsonify({"audio_path": audio_path}), 200
+        return jsonify({"job_id": job_id, "audio_path": audio_path, "status": "recording"}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Detener explícitamente una grabación en curso (POST)
+@app.route('/record-audio/stop', methods=['POST'])
+def stop_recording():
+    try:
+        evict_recordings()
+        job_id = get_job_id()
+        with recordings_lock:
+            recorder = recordings.get(job_id)
+        if not recorder:
+            raise Exception("No hay una grabación en curso para este trabajo.")
+        recorder.stop()
+        return jsonify({"job_id": job_id, "status": "stopped", "seconds": round(recorder.seconds, 2)}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -76,26 +145,49 @@ def record_audio():
 @app.route('/audio-to-text', methods=['GET'])
 def audio_to_text():
     try:
-        audio_path = read_from_file("audio_path.txt")
+        evict_recordings()
+        job_id = get_job_id()
+        with recordings_lock:
+            recorder = recordings.pop(job_id, None)
+        if recorder:
+            # La grabación se fue transcribiendo mientras llegaba: solo falta esperar al último trozo
+            transcription = recorder.result(RECORD_RESULT_TIMEOUT)
+            if not transcription:
+                raise Exception("Error al transcribir el audio.")
+            jobs.set(job_id, "transcription", transcription)
+            return jsonify({"job_id": job_id, "transcription": transcription,
+                            "recorded_seconds": round(recorder.seconds, 2)}), 200
+
+        audio_path = jobs.get(job_id, "audio_path")
         if not audio_path:
             raise Exception("No hay audio grabado disponible para transcribir.")
         
-        transcription = art_mind.audio_to_text(audio_path)
+        audio_report = {}
+        transcription = art_mind.audio_to_text(audio_path, audio_report)
         if not transcription:
             raise Exception("Error al transcribir el audio.")
         
         # Guardar la transcripción
-        save_to_file("transcription.txt", transcription)
+        jobs.set(job_id, "transcription", transcription)
         
-        return jsonify({"transcription": transcription}), 200
+        return jsonify({"job_id": job_id, "transcription": transcription, "audio_report": audio_report}), 200
+    except IncompleteTranscription as e:
+        return incomplete_transcription_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+def incomplete_transcription_response(error):
+    """502 con los trozos que fallaron y el texto parcial, en lugar de dar por buena una transcripción incompleta."""
+    return jsonify({"error": str(error), "failed_segments": error.failed_segments, "segments": error.segments,
+                    "partial_transcription": error.partial_text}), 502
+
 # 3. Endpoint para traducir el texto (GET)
 @app.route('/translate-text', methods=['GET'])
 def translate_text():
     try:
-        transcription = read_from_file("transcription.txt")
+        job_id = get_job_id()
+        transcription = jobs.get(job_id, "transcription")
         if not transcription:
             raise Exception("No hay transcripción disponible para traducir.")
         
@@ -104,9 +196,9 @@ def translate_text():
             raise Exception("Error al traducir el texto.")
         
         # Guardar la traducción
-        save_to_file("translation.txt", translation)
+        jobs.set(job_id, "translation", translation)
         
-        return jsonify({"translation": translation}), 200
+        return jsonify({"job_id": job_id, "translation": translation}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -114,7 +206,8 @@ def translate_text():
 @app.route('/generate-image-with-logo', methods=['GET'])
 def generate_image_with_logo():
     try:
-        translation = read_from_file("translation.txt")
+        job_id = get_job_id()
+        translation = jobs.get(job_id, "translation")
         if not translation:
             raise Exception("No hay texto traducido disponible para generar la imagen.")
         
@@ -123,9 +216,9 @@ def generate_image_with_logo():
         if not image_url:
             raise Exception("Error al generar la imagen.")
         
-        # 2. Añadir el logo a la imagen generada
-        image_with_logo_path = art_mind.add_logo_to_image(image_url)
-        if not image_with_logo_path:
+        # 2. Añadir el logo a la imagen generada (en memoria)
+        image_with_logo = art_mind.add_logo_to_image(image_url)
+        if not image_with_logo:
             raise Exception("Error al añadir el logo a la imagen.")
         
         # 3. Usar el texto traducido para generar un nombre de archivo único
@@ -133,18 +226,153 @@ def generate_image_with_logo():
         firebase_path = f"generated_images/{clean_translation}.png"
         
         # 4. Subir la imagen con el logo a Firebase Storage
-        firebase_url = upload_to_firebase(image_with_logo_path, firebase_path)
+        firebase_url = upload_to_firebase(image_with_logo, firebase_path)
         if not firebase_url:
             raise Exception("Error al subir la imagen con logo a Firebase.")
 
-        return jsonify({
+        result = {
+            "job_id": job_id,
             "image_url": image_url,
-            "image_with_logo_path": image_with_logo_path,
             "firebase_url": firebase_url
-        }), 200
+        }
+        if art_mind.image_output:
+            result["image_with_logo_path"] = art_mind.image_output
+
+        return jsonify(result), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def sse_event(event, data):
+    """Formatea un evento Server-Sent Events con datos JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def voice_to_image_stages(job_id, audio_path):
+    """Ejecuta audio → texto → traducción → imagen → logo → subida, emitiendo un evento SSE por etapa."""
+    try:
+        audio_report = {}
+        transcription = art_mind.audio_to_text(audio_path, audio_report)
+        if not transcription:
+            raise Exception("Error al transcribir el audio.")
+        jobs.set(job_id, "transcription", transcription)
+        yield sse_event("transcription", {"job_id": job_id, "transcription": transcription,
+                                          "audio_report": audio_report})
+
+        translation = art_mind.translate_text(transcription)
+        if not translation:
+            raise Exception("Error al traducir el texto.")
+        jobs.set(job_id, "translation", translation)
+        yield sse_event("translation", {"job_id": job_id, "translation": translation})
+
+        image_url = art_mind.generate_image(translation)
+        if not image_url:
+            raise Exception("Error al generar la imagen.")
+        yield sse_event("image", {"job_id": job_id, "image_url": image_url})
+
+        image_with_logo = art_mind.add_logo_to_image(image_url)
+        if not image_with_logo:
+            raise Exception("Error al añadir el logo a la imagen.")
+
+        firebase_path = f"generated_images/{clean_filename(translation)}.png"
+        firebase_url = upload_to_firebase(image_with_logo, firebase_path)
+        if not firebase_url:
+            raise Exception("Error al subir la imagen con logo a Firebase.")
+        jobs.set(job_id, "firebase_url", firebase_url)
+
+        yield sse_event("done", {
+            "job_id": job_id,
+            "transcription": transcription,
+            "translation": translation,
+            "image_url": image_url,
+            "firebase_url": firebase_url
+        })
+    except Exception as e:
+        yield sse_event("error", {"job_id": job_id, "error": str(e)})
+    finally:
+        try:
+            os.remove(audio_path)
+        except OSError:
+            pass
+
+# 5. Endpoint de una sola llamada: recibe el audio y emite el progreso de cada etapa (SSE)
+@app.route('/voice-to-image', methods=['POST'])
+def voice_to_image():
+    try:
+        audio = request.files.get("audio")
+        if not audio:
+            raise Exception("Se necesita un archivo de audio en el campo 'audio'.")
+
+        job_id = get_job_id(create=True)
+        extension = os.path.splitext(audio.filename or "")[1] or ".wav"
+        if not re.fullmatch(r'\.[A-Za-z0-9]{1,5}', extension):
+            extension = ".wav"
+        audio_path = os.path.join(AUDIO_DIR, f"audio_{job_id}{extension}")
+        audio.save(audio_path)
+        jobs.set(job_id, "audio_path", audio_path)
+
+        return Response(
+            stream_with_context(voice_to_image_stages(job_id, audio_path)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Job-ID": job_id}
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Tamaño de los bloques leídos del cuerpo de /audio-stream
+AUDIO_STREAM_BLOCK = int(os.getenv("AUDIO_STREAM_BLOCK", str(64 * 1024)))
+
+# 6. Endpoint de ingesta en streaming: el audio llega por bloques (Transfer-Encoding: chunked)
+@app.route('/audio-stream', methods=['POST'])
+def audio_stream():
+    try:
+        job_id = get_job_id(create=True)
+        # Sin sample_rate el cuerpo debe ser un WAV; con sample_rate se trata como PCM int16 crudo
+        sample_rate = request.args.get("sample_rate", type=int)
+        channels = request.args.get("channels", default=1, type=int)
+        transcriber = art_mind.stream_transcriber(sample_rate=sample_rate, channels=channels)
+
+        # Cada trozo se envía a transcribir en cuanto aparece un silencio, mientras sigue llegando el resto
+        while True:
+            block = request.stream.read(AUDIO_STREAM_BLOCK)
+            if not block:
+                break
+            transcriber.feed(block)
+
+        transcription = transcriber.finish()
+        if not transcription:
+            raise Exception("Error al transcribir el audio.")
+        jobs.set(job_id, "transcription", transcription)
+
+        return jsonify({
+            "job_id": job_id,
+            "transcription": transcription,
+            "bytes_received": transcriber.bytes_in,
+            "bytes_sent_to_whisper": transcriber.bytes_out
+        }), 200
+    except IncompleteTranscription as e:
+        return incomplete_transcription_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/stats/translation', methods=['GET'])
+def translation_stats():
+    """Aciertos, fallos y traducciones omitidas de la caché de traducción."""
+    return jsonify(translation_cache.stats()), 200
+
+@app.route('/stats/audio', methods=['GET'])
+def audio_stats_endpoint():
+    """Bytes ahorrados por el preprocesado y tiempo medio de transcripción con y sin él."""
+    return jsonify(audio_stats.snapshot()), 200
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latencia, bytes y errores por etapa, aciertos de caché y estado de OpenAI en formato Prometheus."""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+@app.route('/stats/openai', methods=['GET'])
+def openai_stats():
+    """Profundidad de la cola, peticiones en vuelo y tiempos de espera de las llamadas a OpenAI."""
+    return jsonify(openai_client.metrics.snapshot()), 200
+
 if __name__ == '__main__':
     app.run(debug=True)
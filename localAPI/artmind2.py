@@ -1,13 +1,35 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 import gradio as gr
 import webbrowser
 from io import BytesIO
 from PIL import Image
-import requests
-import qrcode
+import httpx
+import shared  # noqa: F401  Módulos comunes de la raíz del repositorio
+import http_pool
+from language import translate_cached
+from qr_service import qr_service
+
+# Cliente de OpenAI con pool de conexiones keep-alive, timeouts y reintentos configurables
+client = OpenAI(
+    http_client=httpx.Client(
+        limits=httpx.Limits(max_connections=http_pool.POOL_MAXSIZE,
+                            max_keepalive_connections=http_pool.POOL_MAXSIZE),
+        timeout=httpx.Timeout(http_pool.READ_TIMEOUT, connect=http_pool.CONNECT_TIMEOUT),
+    ),
+    max_retries=http_pool.RETRIES,
+)
+
+# Concurrencia de la interfaz (variables de entorno)
+GRADIO_CONCURRENCY = int(os.getenv("GRADIO_CONCURRENCY", "4"))
+GRADIO_QUEUE_SIZE = int(os.getenv("GRADIO_QUEUE_SIZE", "32"))
+# Hilos para las etapas que se solapan dentro de una misma petición (el QR mientras se descarga la imagen)
+stage_executor = ThreadPoolExecutor(max_workers=GRADIO_CONCURRENCY, thread_name_prefix="stage")
 
-client = OpenAI()
+# Cargar el logo una sola vez (logo_frojo_tblanco.png) en lugar de abrirlo en cada petición
+logo = Image.open("logo.png")
+logo.load()
 
 
 def speech_to_text(audio):
@@ -25,6 +47,11 @@ def speech_to_text(audio):
 
 
 def translate(text, language="en"):
+    # Si Whisper ya produjo texto en el idioma destino (o ya se tradujo antes), no se llama al modelo
+    return translate_cached(text, language, translate_with_openai) or ""
+
+
+def translate_with_openai(text):
     try:
         completion = client.chat.completions.create(
             model="gpt-3.5-turbo",
@@ -58,29 +85,28 @@ def image_generator(prompt):
 
 def qrcode_generator(text):
     try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(text)
-        qr.make(fit=True)
-
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_img_byte = BytesIO()
-        qr_img.save(qr_img_byte, format='PNG')
-        qr_img_byte.seek(0)
-        return Image.open(qr_img_byte)
+        # Imagen construida desde la matriz en caché, sin codificar y volver a abrir un PNG
+        return qr_service.image(text, error_correction="L", box_size=10)
     except Exception as e:
         print(f"Error en la generación del código QR: {e}")
         return None
 
 
+def download_with_logo(image_url):
+    """Descarga la imagen generada y superpone el logo en la esquina inferior derecha."""
+    response = http_pool.get_session().get(image_url)
+    response.raise_for_status()
+    image = Image.open(BytesIO(response.content))
+    image.paste(logo, (image.width - logo.width, image.height - logo.height), logo)
+    return image
+
+
 def multi_model(audio):
+    """Genera las salidas por etapas: primero la transcripción y luego la imagen y el QR, en cuanto están listos."""
     # Transcripción de voz a texto
     text = speech_to_text(audio)
     print(f'\nSPEECH TO TEXT: {text}')
+    yield text, None, None
 
     # Traducción del texto
     translated_text = translate(text)
@@ -90,17 +116,15 @@ def multi_model(audio):
     revised_prompt, image_url = image_generator(translated_text)
     print(f'\nMAGIC PROMPT: {revised_prompt}')
     print(f'\nIMAGE URL: {image_url}')
-    image = Image.open(BytesIO(requests.get(image_url).content))
-    print(f'\nIMAGE: {image}')
 
-    # Cargar imagen (logo_frojo_tblanco.png) y superponerla a la imagen generada en la esquina inferior derecha
-    logo = Image.open("logo.png")
-    image.paste(logo, (image.width - logo.width, image.height - logo.height), logo)
-
-    # Generación de código QR
-    qr_code = qrcode_generator(image_url)
+    # El código QR solo depende de la URL: se genera mientras la imagen se descarga y se le añade el logo
+    qr_future = stage_executor.submit(qrcode_generator, image_url)
+    image = download_with_logo(image_url)
+    print(f'\nIMAGE: {image}')
+    if not qr_future.done():
+        yield text, image, None
 
-    return text, image, qr_code
+    yield text, image, qr_future.result()
 
 
 output_text = gr.Textbox(label="Texto transcrito")
@@ -122,6 +146,8 @@ ui = gr.Interface(
     title="ArtMind",
     description=description,
 )
+# Cola de Gradio: GRADIO_CONCURRENCY usuarios se atienden a la vez y el resto espera turno (hasta GRADIO_QUEUE_SIZE)
+ui.queue(default_concurrency_limit=GRADIO_CONCURRENCY, max_size=GRADIO_QUEUE_SIZE)
 
 if __name__ == "__main__":
     ui.launch(share=True)
@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from io import BytesIO
+from math import gcd
+
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+
+from audio_stream import TARGET_RATE, to_wav_bytes
+
+# Preprocesado antes de enviar el audio a Whisper (variables de entorno)
+PREPROCESS_ENABLED = os.getenv("AUDIO_PREPROCESS", "1") == "1"
+VAD_THRESHOLD = float(os.getenv("VAD_THRESHOLD", "0.01"))  # RMS mínimo de una trama con voz, escala [-1, 1]
+VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", "30"))
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "200"))  # Margen que se conserva antes y después de la voz
+AUDIO_CODEC = os.getenv("AUDIO_CODEC", "wav")  # wav | flac | ogg | mp3 (los comprimidos necesitan pydub y ffmpeg)
+# Con AUDIO_PREPROCESS_COMPARE=1 cada petición transcribe también el audio sin procesar para medir la diferencia
+# real de latencia (duplica las llamadas a Whisper; pensado para pruebas)
+PREPROCESS_COMPARE = os.getenv("AUDIO_PREPROCESS_COMPARE", "0") == "1"
+
+
+def to_float_mono(data):
+    """Convierte las muestras leídas de un WAV (int16, int32, uint8 o float) a float32 mono en [-1, 1]."""
+    if data.dtype == np.uint8:
+        samples = (data.astype(np.float32) - 128) / 128
+    elif np.issubdtype(data.dtype, np.integer):
+        samples = data.astype(np.float32) / np.iinfo(data.dtype).max
+    else:
+        samples = data.astype(np.float32)
+    return samples.mean(axis=1) if samples.ndim > 1 else samples
+
+
+def resample(samples, rate, target_rate=TARGET_RATE):
+    """Cambia la frecuencia de muestreo con un filtro polifásico."""
+    if rate == target_rate:
+        return samples
+    factor = gcd(rate, target_rate)
+    return resample_poly(samples, target_rate // factor, rate // factor).astype(np.float32)
+
+
+def trim_silence(samples, rate, threshold=VAD_THRESHOLD, frame_ms=VAD_FRAME_MS, padding_ms=VAD_PADDING_MS):
+    """VAD por energía: recorta el silencio del principio y del final; si todo es silencio devuelve un array vacío."""
+    frame = max(1, rate * frame_ms // 1000)
+    count = len(samples) // frame
+    if count == 0:
+        return samples
+    energy = np.sqrt(np.mean(samples[:count * frame].reshape(count, frame) ** 2, axis=1))
+    voiced = np.flatnonzero(energy >= threshold)
+    if len(voiced) == 0:
+        return samples[:0]
+    padding = rate * padding_ms // 1000
+    start = max(0, voiced[0] * frame - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame + padding)
+    return samples[start:end]
+
+
+def encode_audio(samples, codec=AUDIO_CODEC, rate=TARGET_RATE):
+    """Codifica el audio para la subida; si el códec comprimido no está disponible usa WAV."""
+    if codec != "wav":
+        try:
+            from pydub import AudioSegment
+
+            pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+            buffer = BytesIO()
+            AudioSegment(data=pcm, sample_width=2, frame_rate=rate, channels=1).export(buffer, format=codec)
+            buffer.seek(0)
+            buffer.name = f"audio.{codec}"  # El SDK de OpenAI deduce el formato por el nombre
+            return buffer
+        except Exception as e:
+            print(f"Error al codificar el audio en {codec}, se usa WAV: {e}")
+    return to_wav_bytes(samples, rate)
+
+
+def preprocess_audio(audio_path, codec=AUDIO_CODEC):
+    """Recorta silencios, pasa a 16 kHz mono y codifica; devuelve (archivo en memoria, informe) o (None, informe) si no hay voz."""
+    start = time.perf_counter()
+    rate, data = wavfile.read(audio_path)
+    samples = to_float_mono(data)
+    trimmed = trim_silence(samples, rate)
+    report = {
+        "original_bytes": os.path.getsize(audio_path),
+        "original_seconds": round(len(samples) / rate, 3),
+        "trimmed_seconds": round(len(trimmed) / rate, 3),
+    }
+    if len(trimmed) == 0:
+        report["preprocess_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return None, report
+
+    audio = encode_audio(resample(trimmed, rate), codec)
+    report["processed_bytes"] = len(audio.getbuffer())
+    report["bytes_saved"] = report["original_bytes"] - report["processed_bytes"]
+    report["codec"] = os.path.splitext(audio.name)[1].lstrip(".")
+    report["preprocess_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return audio, report
+
+
+def compare_latency(report, raw_transcribe_ms=None):
+    """Añade al informe de una petición la subida y el tiempo con y sin preprocesado.
+
+    `raw_transcribe_ms` es la transcripción del audio original medida en la misma petición
+    (AUDIO_PREPROCESS_COMPARE=1). Sin ella se estima escalando el tiempo de la transcripción
+    por la duración del audio: Whisper tarda en proporción a los segundos que recibe.
+    """
+    if not report.get("preprocessed") or "processed_bytes" not in report or "transcribe_ms" not in report:
+        return report
+    if raw_transcribe_ms is None:
+        ratio = report["original_seconds"] / report["trimmed_seconds"] if report["trimmed_seconds"] else 1.0
+        raw_transcribe_ms = report["transcribe_ms"] * ratio
+        report["latency_source"] = "estimated"
+    else:
+        report["latency_source"] = "measured"
+    report["upload_bytes"] = {"raw": report["original_bytes"], "processed": report["processed_bytes"]}
+    report["total_ms"] = {"raw": round(raw_transcribe_ms, 1),
+                          "processed": round(report["preprocess_ms"] + report["transcribe_ms"], 1)}
+    report["latency_delta_ms"] = round(report["total_ms"]["processed"] - report["total_ms"]["raw"], 1)
+    return report
+
+
+class AudioStats:
+    """Acumula bytes ahorrados y tiempos de transcripción con y sin preprocesado para estimar la diferencia de latencia."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bytes_saved = 0
+        self.modes = {"raw": [0, 0.0], "preprocessed": [0, 0.0]}  # modo: [peticiones, ms totales]
+        self.deltas = {"measured": [0, 0.0], "estimated": [0, 0.0]}  # origen: [peticiones, suma de diferencias]
+
+    def record(self, report):
+        mode = "preprocessed" if report.get("preprocessed") else "raw"
+        total_ms = report.get("preprocess_ms", 0) + report.get("transcribe_ms", 0)
+        with self._lock:
+            self.bytes_saved += report.get("bytes_saved", 0)
+            self.modes[mode][0] += 1
+            self.modes[mode][1] += total_ms
+            if "latency_delta_ms" in report:
+                self.deltas[report["latency_source"]][0] += 1
+                self.deltas[report["latency_source"]][1] += report["latency_delta_ms"]
+
+    def snapshot(self):
+        with self._lock:
+            averages = {mode: round(total / count, 1) if count else None
+                        for mode, (count, total) in self.modes.items()}
+            snapshot = {"bytes_saved": self.bytes_saved,
+                        "requests": {mode: count for mode, (count, _) in self.modes.items()},
+                        "avg_total_ms": averages,
+                        # Media de las diferencias por petición (preprocesado menos original)
+                        "avg_request_latency_delta_ms": {source: round(total / count, 1) if count else None
+                                                         for source, (count, total) in self.deltas.items()}}
+        if averages["raw"] is not None and averages["preprocessed"] is not None:
+            snapshot["latency_delta_ms"] = round(averages["preprocessed"] - averages["raw"], 1)
+        return snapshot
+
+
+audio_stats = AudioStats()
@@ -0,0 +1,245 @@
+import os
+import struct
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from math import gcd
+
+import numpy as np
+from scipy.signal import firwin, upfirdn
+
+# Parámetros de la ingesta en streaming (variables de entorno)
+TARGET_RATE = 16000  # Whisper trabaja internamente a 16 kHz mono
+FRAME_MS = 30
+SILENCE_THRESHOLD = float(os.getenv("STREAM_SILENCE_THRESHOLD", "0.01"))  # RMS en escala [-1, 1]
+MIN_SILENCE_S = float(os.getenv("STREAM_MIN_SILENCE", "0.6"))  # Silencio que marca un corte
+MIN_SEGMENT_S = float(os.getenv("STREAM_MIN_SEGMENT", "3"))  # No cortar trozos más cortos
+MAX_SEGMENT_S = float(os.getenv("STREAM_MAX_SEGMENT", "30"))  # Cortar aunque no haya silencio
+TRANSCRIBE_WORKERS = int(os.getenv("STREAM_TRANSCRIBE_WORKERS", "4"))
+
+# Pool compartido por todas las ingestas para transcribir trozos en paralelo
+transcribe_executor = ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS)
+
+
+def to_wav_bytes(samples, sample_rate=TARGET_RATE):
+    """Codifica muestras float [-1, 1] mono como WAV int16 en memoria, listo para enviar a Whisper."""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    buffer = BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    buffer.seek(0)
+    buffer.name = "chunk.wav"  # El SDK de OpenAI deduce el formato por el nombre
+    return buffer
+
+
+def parse_wav_header(data):
+    """Lee la cabecera de un WAV PCM; devuelve (sample_rate, canales, bytes por muestra, offset de datos) o None."""
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    offset, fmt = 12, None
+    while offset + 8 <= len(data):
+        chunk_id, size = data[offset:offset + 4], struct.unpack("<I", data[offset + 4:offset + 8])[0]
+        if chunk_id == b"fmt ":
+            if offset + 8 + 16 > len(data):
+                return None
+            _, channels, rate, _, _, bits = struct.unpack("<HHIIHH", data[offset + 8:offset + 24])
+            fmt = (rate, channels, bits // 8)
+        elif chunk_id == b"data":
+            return (*fmt, offset + 8) if fmt else None
+        offset += 8 + size + (size % 2)
+    return None
+
+
+class StreamResampler:
+    """Remuestreo polifásico por bloques que conserva el historial del filtro entre bloques.
+
+    Usa el mismo filtro FIR que scipy.signal.resample_poly (Kaiser, beta 5), así que la salida
+    concatenada de process() coincide con remuestrear el audio entero de una vez: no hay efectos
+    de borde en las fronteras de bloque ni deriva en la longitud.
+    """
+
+    def __init__(self, in_rate, out_rate):
+        factor = gcd(in_rate, out_rate)
+        self.up, self.down = out_rate // factor, in_rate // factor
+        if self.up == self.down:
+            return  # Misma frecuencia: process() devuelve las muestras tal cual
+        max_rate = max(self.up, self.down)
+        half_len = 10 * max_rate
+        pre_pad = self.down - half_len % self.down
+        taps = firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0)) * self.up
+        self.taps = np.concatenate((np.zeros(pre_pad), taps))
+        self.delay = (half_len + pre_pad) // self.down  # Muestras de salida que adelanta el filtro
+        self._history = np.zeros(0)  # Entrada que aún necesitan las próximas salidas
+        self._history_start = 0  # Índice absoluto de la primera muestra de _history
+        self._received = 0
+        self._emitted = 0
+
+    def _first_input(self, output_index):
+        """Primera muestra de entrada que usa la salida `output_index` (múltiplo de down, para alinear las fases)."""
+        first = -(-(output_index * self.down - len(self.taps) + 1) // self.up)
+        first = max(first, 0)
+        return first - first % self.down
+
+    def process(self, samples, final=False):
+        """Añade muestras y devuelve las salidas que ya se pueden calcular; con final=True, también la cola."""
+        if self.up == self.down:
+            return np.asarray(samples, dtype=np.float64)
+        self._history = np.concatenate((self._history, samples))
+        self._received += len(samples)
+        if final:
+            end = -(-self._received * self.up // self.down)  # Mismo número de salidas que resample_poly
+        else:
+            # Solo las salidas cuyas muestras de entrada ya llegaron
+            end = (self._received * self.up - 1) // self.down + 1 - self.delay
+        start = self._emitted
+        if end <= start:
+            return np.zeros(0)
+
+        # Salidas [start, end) = posiciones [start + delay, end + delay) de la convolución completa
+        first = self._first_input(start + self.delay)
+        last = min(self._received, ((end + self.delay - 1) * self.down) // self.up + 1)
+        window = self._history[first - self._history_start:last - self._history_start]
+        filtered = upfirdn(self.taps, window, self.up, self.down)
+        skip = start + self.delay - first * self.up // self.down
+        output = filtered[skip:skip + end - start]
+        if len(output) < end - start:
+            output = np.concatenate((output, np.zeros(end - start - len(output))))
+
+        self._emitted = end
+        keep = self._first_input(end + self.delay)
+        self._history = self._history[keep - self._history_start:]
+        self._history_start = keep
+        return output
+
+
+class IncompleteTranscription(Exception):
+    """Algún trozo del audio no se pudo transcribir: lleva cuántos fallaron y el texto de los demás."""
+
+    def __init__(self, failed_segments, segments, partial_text):
+        super().__init__(f"No se pudieron transcribir {failed_segments} de {segments} trozos del audio.")
+        self.failed_segments = failed_segments
+        self.segments = segments
+        self.partial_text = partial_text
+
+
+class StreamingTranscriber:
+    """Ingesta de audio por bloques: baja a 16 kHz mono al vuelo, corta en los silencios y transcribe
+    cada trozo en paralelo mientras el resto del audio sigue llegando.
+
+    `transcribe_fn(archivo_wav)` devuelve el texto de un trozo (None si falla). Al final, finish()
+    une las transcripciones parciales en orden, o lanza IncompleteTranscription si falló algún trozo.
+    """
+
+    def __init__(self, transcribe_fn, sample_rate=None, channels=1, sample_width=2, executor=None):
+        self.transcribe_fn = transcribe_fn
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.executor = executor or transcribe_executor
+        self._header = b"" if sample_rate is None else None  # Sin formato explícito se espera un WAV
+        self._leftover = b""
+        self._resampler = None  # Se crea al conocer la frecuencia de entrada
+        self._segment = []  # Bloques de muestras a 16 kHz del trozo actual
+        self._segment_len = 0
+        self._silence_len = 0
+        self._futures = []
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.segments = 0  # Trozos enviados a transcribir y cuántos fallaron (se conocen tras finish())
+        self.failed_segments = 0
+
+    def _configure(self, data):
+        """Acumula bytes hasta poder leer la cabecera WAV; devuelve los datos PCM que la siguen."""
+        self._header += data
+        parsed = parse_wav_header(self._header)
+        if parsed is None:
+            if len(self._header) > 1 << 16:
+                raise ValueError("El audio no es un WAV PCM válido.")
+            return b""
+        self.sample_rate, self.channels, self.sample_width, data_offset = parsed
+        if self.sample_width != 2:
+            raise ValueError("Solo se admite audio PCM de 16 bits.")
+        data, self._header = self._header[data_offset:], None
+        return data
+
+    def _to_mono_16k(self, data):
+        data = self._leftover + data
+        frame_bytes = self.sample_width * self.channels
+        usable = len(data) - len(data) % frame_bytes
+        data, self._leftover = data[:usable], data[usable:]
+        if not data:
+            return np.zeros(0, dtype=np.float32)
+        samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+        samples = samples.reshape(-1, self.channels).mean(axis=1)
+        return self._resample(samples)
+
+    def _resample(self, samples, final=False):
+        # Un único remuestreador por ingesta: el filtro conserva su estado entre bloques
+        if self._resampler is None:
+            self._resampler = StreamResampler(self.sample_rate, TARGET_RATE)
+        return self._resampler.process(samples, final=final).astype(np.float32)
+
+    def feed(self, data):
+        """Añade un bloque de bytes recibido del cliente."""
+        self.bytes_in += len(data)
+        if self._header is not None:
+            data = self._configure(data)
+            if self._header is not None:
+                return
+        self._segment_samples(self._to_mono_16k(data))
+
+    def _segment_samples(self, samples):
+        """Corta las muestras a 16 kHz en trozos por los silencios y envía a transcribir los completos."""
+        frame = TARGET_RATE * FRAME_MS // 1000
+        for start in range(0, len(samples), frame):
+            chunk = samples[start:start + frame]
+            self._segment.append(chunk)
+            self._segment_len += len(chunk)
+            quiet = np.sqrt(np.mean(chunk ** 2)) < SILENCE_THRESHOLD
+            self._silence_len = self._silence_len + len(chunk) if quiet else 0
+
+            duration = self._segment_len / TARGET_RATE
+            at_pause = self._silence_len / TARGET_RATE >= MIN_SILENCE_S and duration >= MIN_SEGMENT_S
+            if at_pause or duration >= MAX_SEGMENT_S:
+                self._flush()
+
+    def _flush(self):
+        if not self._segment:
+            return
+        samples = np.concatenate(self._segment)
+        self._segment, self._segment_len, self._silence_len = [], 0, 0
+        # Un trozo que es todo silencio no se envía
+        if np.sqrt(np.mean(samples ** 2)) < SILENCE_THRESHOLD:
+            return
+        wav = to_wav_bytes(samples)
+        self.bytes_out += len(wav.getbuffer())
+        self._futures.append(self.executor.submit(self.transcribe_fn, wav))
+
+    def finish(self):
+        """Envía lo que queda y devuelve la transcripción completa, uniendo los trozos en orden.
+
+        Si algún trozo no se pudo transcribir lanza IncompleteTranscription en lugar de devolver
+        un texto al que le faltan partes.
+        """
+        if self._header is not None and self._header:
+            raise ValueError("El audio no es un WAV PCM válido.")
+        if self._resampler is not None:
+            # La cola del filtro: las últimas muestras que dependían de audio todavía por llegar
+            self._segment_samples(self._resample(np.zeros(0), final=True))
+        self._flush()
+        texts = []
+        for future in self._futures:
+            try:
+                texts.append(future.result())
+            except Exception as e:
+                print(f"Error en la transcripción del trozo de audio: {e}")
+                texts.append(None)
+        self.segments = len(texts)
+        self.failed_segments = sum(1 for text in texts if text is None)
+        transcription = " ".join(text.strip() for text in texts if text and text.strip())
+        if self.failed_segments:
+            raise IncompleteTranscription(self.failed_segments, self.segments, transcription)
+        return transcription
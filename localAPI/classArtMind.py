@@ -1,54 +1,136 @@
 import openai
-import sounddevice as sd
-import numpy as np
-from scipy.io.wavfile import write
 import os
+import time
 from dotenv import load_dotenv
 from PIL import Image
 from io import BytesIO
-import requests
+import shared  # noqa: F401  Módulos comunes de la raíz del repositorio
+from http_pool import get_session, use_for_openai
+from language import translate_cached
+from openai_client import openai_client
+from metrics import metrics
+from logo_cache import logo_cache
+from audio_stream import StreamingTranscriber, transcribe_executor
+from recorder import MicrophoneSource, StreamingRecorder
+from audio_preprocess import (PREPROCESS_COMPARE, PREPROCESS_ENABLED, audio_stats, compare_latency,
+                              preprocess_audio)
 
 class ArtMind:
-    def __init__(self, audio_file="audio.wav", image_output="image_with_logo.png", logo_file="logo.png"):
+    def __init__(self, audio_file="audio.wav", image_output=None, logo_file="logo.png"):
         # Cargar las variables de entorno desde el archivo .env
         load_dotenv()
         self.api_key = os.getenv("OPENAI_API_KEY")
         openai.api_key = self.api_key
+        # Reutilizar conexiones keep-alive para OpenAI y para las descargas de imágenes
+        use_for_openai()
         
         # Parámetros de grabación
         self.fs = 44100  # Frecuencia de muestreo
-        self.seconds = 5  # Duración de la grabación
         self.audio_file = audio_file
+        # Ruta opcional para guardar en disco la imagen con el logo (solo para depuración)
         self.image_output = image_output
         self.logo_file = logo_file
 
-    def record_audio(self):
-        """Graba audio y guarda en un archivo WAV."""
+    def start_recording(self, audio_file=None, source=None):
+        """Empieza a grabar sin bloquear y devuelve el StreamingRecorder.
+
+        Los bloques se transcriben a medida que llegan; la grabación termina con stop() o al detectar
+        silencio. `source` permite grabar desde un WAV o una señal sintética en lugar del micrófono.
+        """
+        audio_file = audio_file or self.audio_file
+        source = source or MicrophoneSource(self.fs)
+        transcriber = self.stream_transcriber(sample_rate=source.fs, channels=source.channels)
+        return StreamingRecorder(source, sink=transcriber, audio_file=audio_file).start()
+
+    def record_audio(self, audio_file=None, source=None):
+        """Graba audio hasta detectar silencio y guarda en un archivo WAV (por defecto en self.audio_file)."""
+        audio_file = audio_file or self.audio_file
         try:
             print("Grabando...")
-            audio_data = sd.rec(int(self.seconds * self.fs), samplerate=self.fs, channels=1, dtype=np.int16)
-            sd.wait()  # Esperar a que la grabación termine
-            write(self.audio_file, self.fs, audio_data)
-            print(f"Grabación completada. Archivo guardado en {self.audio_file}")
-            return self.audio_file
+            source = source or MicrophoneSource(self.fs)
+            recorder = StreamingRecorder(source, audio_file=audio_file).start()
+            recorder.wait()
+            if recorder.error:
+                raise recorder.error
+            print(f"Grabación completada. Archivo guardado en {audio_file}")
+            return audio_file
         except Exception as e:
             print(f"Error al grabar audio: {e}")
             return None
 
-    def audio_to_text(self, audio_path):
-        """Convierte el audio en texto usando OpenAI."""
+    @metrics.timed("audio_to_text", bytes_arg=1)
+    def audio_to_text(self, audio_path, report=None):
+        """Convierte el audio en texto usando OpenAI.
+
+        Si AUDIO_PREPROCESS está activo, antes recorta los silencios y lo pasa a 16 kHz mono;
+        `report` (un dict opcional) recibe los bytes ahorrados, los tiempos de cada paso y la diferencia
+        de subida y latencia frente a enviar el audio original.
+        """
+        report = {} if report is None else report
         try:
-            with open(audio_path, "rb") as audio_file:
-                transcription = openai.Audio.transcribe(model="whisper-1", file=audio_file)
+            audio = None
+            if PREPROCESS_ENABLED:
+                try:
+                    audio, details = preprocess_audio(audio_path)
+                    report.update(details, preprocessed=True)
+                except Exception as e:
+                    # Formatos que no son WAV se envían tal cual
+                    print(f"Error al preprocesar el audio, se envía sin cambios: {e}")
+                if report.get("preprocessed") and audio is None:
+                    raise Exception("El audio no contiene voz.")
+
+            # Con AUDIO_PREPROCESS_COMPARE=1 el audio original se transcribe a la vez para medir su latencia
+            raw_future = None
+            if audio is not None and PREPROCESS_COMPARE:
+                raw_future = transcribe_executor.submit(self._timed_raw_transcription, audio_path)
+
+            start = time.perf_counter()
+            if audio is None:
+                with open(audio_path, "rb") as audio_file:
+                    transcription = openai_client.transcribe(audio_file, model="whisper-1")
+            else:
+                transcription = openai_client.transcribe(audio, model="whisper-1")
+            report["transcribe_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            compare_latency(report, raw_future.result() if raw_future else None)
+            audio_stats.record(report)
             return transcription['text']
         except Exception as e:
             print(f"Error en la transcripción del audio: {e}")
             return None
 
+    def _timed_raw_transcription(self, audio_path):
+        """Transcribe el audio original solo para medir cuánto tarda (ms); None si falla."""
+        try:
+            start = time.perf_counter()
+            with open(audio_path, "rb") as audio_file:
+                openai_client.transcribe(audio_file, model="whisper-1")
+            return (time.perf_counter() - start) * 1000
+        except Exception as e:
+            print(f"Error al transcribir el audio original para comparar: {e}")
+            return None
+
+    @metrics.timed("transcribe_chunk", bytes_arg=1)
+    def transcribe_chunk(self, audio_file):
+        """Transcribe un trozo de audio en memoria (un WAV en BytesIO) usando OpenAI."""
+        try:
+            return openai_client.transcribe(audio_file, model="whisper-1")['text']
+        except Exception as e:
+            print(f"Error en la transcripción del trozo de audio: {e}")
+            return None
+
+    def stream_transcriber(self, sample_rate=None, channels=1):
+        """Crea un transcriptor en streaming: se le pasan bloques de audio con feed() y finish() devuelve el texto."""
+        return StreamingTranscriber(self.transcribe_chunk, sample_rate=sample_rate, channels=channels)
+
+    @metrics.timed("translate_text")
     def translate_text(self, text, language="en"):
+        """Traduce el texto al inglés; no llama a OpenAI si ya está en inglés o si ya se tradujo antes."""
+        return translate_cached(text, language, self._translate_with_openai)
+
+    def _translate_with_openai(self, text):
         """Traduce el texto al inglés usando OpenAI."""
         try:
-            response = openai.ChatCompletion.create(
+            response = openai_client.chat(
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": "Eres un traductor experto en varios idiomas y puedes traducir cualquier texto al inglés."},
@@ -60,10 +142,11 @@ class ArtMind:
             print(f"Error al traducir el texto: {e}")
             return None
 
+    @metrics.timed("generate_image")
     def generate_image(self, prompt):
         """Genera una imagen basada en el prompt usando DALL-E."""
         try:
-            response = openai.Image.create(
+            response = openai_client.create_image(
                 model="dall-e-3",
                 prompt=prompt,
                 size="1024x1024",
@@ -74,22 +157,30 @@ class ArtMind:
             print(f"Error al generar la imagen: {e}")
             return None
 
+    @metrics.timed("add_logo_to_image", bytes_result=True)
     def add_logo_to_image(self, image_url):
-        """Descarga la imagen generada y le añade un logo."""
+        """Descarga la imagen generada, le añade un logo y la devuelve como PNG en memoria (BytesIO)."""
         try:
             # Descargar la imagen desde la URL
-            image = Image.open(BytesIO(requests.get(image_url).content))
-            
-            # Abrir el logo
-            logo = Image.open(self.logo_file)
-            
-            # Superponer el logo en la esquina inferior derecha
-            image.paste(logo, (image.width - logo.width, image.height - logo.height), logo)
-            
-            # Guardar la imagen con el logo
-            image.save(self.image_output)
-            print(f"Logo añadido y imagen guardada en {self.image_output}")
-            return self.image_output
+            response = get_session().get(image_url)
+            response.raise_for_status()
+
+            with Image.open(BytesIO(response.content)) as image:
+                # Superponer el logo en la esquina inferior derecha (ya decodificado, desde la caché)
+                logo_cache.paste(image, self.logo_file)
+
+                # Codificar la imagen con el logo directamente en memoria
+                buffer = BytesIO()
+                image.save(buffer, format="PNG")
+
+            # Guardar también en disco solo si se pidió (depuración)
+            if self.image_output:
+                with open(self.image_output, "wb") as file:
+                    file.write(buffer.getbuffer())
+                print(f"Logo añadido y imagen guardada en {self.image_output}")
+
+            buffer.seek(0)
+            return buffer
         except Exception as e:
             print(f"Error al añadir el logo a la imagen: {e}")
             return None
\ No newline at end of file
@@ -0,0 +1,123 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Configuración del almacén de trabajos (variables de entorno)
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "memory")  # "memory", "sqlite" o "redis"
+JOB_TTL = float(os.getenv("JOB_TTL", "3600"))  # Segundos que vive un trabajo sin actividad
+JOB_SQLITE_PATH = os.getenv("JOB_STORE_PATH", "jobs.sqlite3")
+JOB_REDIS_URL = os.getenv("JOB_STORE_REDIS_URL", "redis://localhost:6379/0")
+
+
+def new_job_id():
+    """Genera un ID de trabajo nuevo."""
+    return uuid.uuid4().hex
+
+
+class MemoryJobStore:
+    """Estado de cada trabajo en memoria del proceso, con expiración por TTL."""
+
+    def __init__(self, ttl=JOB_TTL):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        expired = [job_id for job_id, (_, expires_at) in self._jobs.items() if expires_at < now]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id, field):
+        """Devuelve un campo del trabajo o None si no existe o expiró."""
+        now = time.time()
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is None or entry[1] < now:
+                return None
+            return entry[0].get(field)
+
+    def set(self, job_id, field, value):
+        """Guarda un campo del trabajo y renueva su TTL."""
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            data = self._jobs.get(job_id, ({}, 0))[0]
+            data[field] = value
+            self._jobs[job_id] = (data, now + self.ttl)
+
+
+class SQLiteJobStore:
+    """Estado de cada trabajo en un sqlite local, compartido entre procesos del mismo host."""
+
+    def __init__(self, path=JOB_SQLITE_PATH, ttl=JOB_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, conn, job_id, now):
+        row = conn.execute("SELECT data, expires_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None or row[1] < now:
+            return None
+        return json.loads(row[0])
+
+    def get(self, job_id, field):
+        data = self._load(self._connect(), job_id, time.time())
+        return data.get(field) if data else None
+
+    def set(self, job_id, field, value):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            data = self._load(conn, job_id, now) or {}
+            data[field] = value
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, data, expires_at) VALUES (?, ?, ?)",
+                (job_id, json.dumps(data), now + self.ttl),
+            )
+            conn.execute("DELETE FROM jobs WHERE expires_at < ?", (now,))
+
+
+class RedisJobStore:
+    """Estado de cada trabajo en un servidor compatible con Redis (un hash por trabajo con EXPIRE)."""
+
+    def __init__(self, url=JOB_REDIS_URL, ttl=JOB_TTL):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.ttl = int(ttl)
+
+    def get(self, job_id, field):
+        return self.client.hget(f"job:{job_id}", field)
+
+    def set(self, job_id, field, value):
+        key = f"job:{job_id}"
+        pipe = self.client.pipeline()
+        pipe.hset(key, field, value)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+
+def build_job_store(backend=JOB_STORE_BACKEND):
+    """Crea el almacén de trabajos configurado."""
+    if backend == "sqlite":
+        return SQLiteJobStore()
+    if backend == "redis":
+        return RedisJobStore()
+    return MemoryJobStore()
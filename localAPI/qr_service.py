@@ -0,0 +1,115 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import qrcode
+from PIL import Image
+
+ERROR_CORRECTION = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+QR_CACHE_SIZE = int(os.getenv("QR_CACHE_SIZE", "256"))
+
+
+class QRService:
+    """Códigos QR con caché LRU indexada por (payload, nivel de corrección).
+
+    El límite (QR_CACHE_SIZE) se cuenta en payloads: cada entrada guarda la matriz de módulos y las
+    salidas ya construidas a partir de ella (imagen o SVG por tamaño de módulo), así pedir la imagen
+    y el SVG de un mismo payload no ocupa dos entradas. La imagen se construye con NumPy (sin
+    codificar y decodificar un PNG) y el SVG se escribe como texto.
+    """
+
+    def __init__(self, max_entries=QR_CACHE_SIZE, border=4):
+        self.max_entries = max_entries
+        self.border = border
+        self._entries = OrderedDict()  # (payload, nivel): {"matrix": ..., ("image", box_size): ..., ...}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _build_matrix(self, payload, error_correction):
+        qr = qrcode.QRCode(error_correction=ERROR_CORRECTION[error_correction], border=self.border)
+        qr.add_data(payload)
+        qr.make(fit=True)
+        modules = np.array(qr.get_matrix(), dtype=bool)
+        modules.setflags(write=False)  # Se comparte entre llamadas
+        return modules
+
+    def _cached(self, payload, error_correction, output, build=None):
+        """Devuelve la salida `output` del payload; si no está, la construye con `build(matriz)` y la guarda."""
+        key = (payload, error_correction)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                value = entry.get(output)
+                if value is not None:
+                    self.hits += 1
+                    return value
+            self.misses += 1
+        modules = entry["matrix"] if entry is not None else self._build_matrix(payload, error_correction)
+        value = modules if build is None else build(modules)
+        with self._lock:
+            entry = self._entries.setdefault(key, {"matrix": modules})
+            entry[output] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def matrix(self, payload, error_correction="L"):
+        """Matriz de módulos (array bool de NumPy, True = negro), con el borde incluido."""
+        return self._cached(payload, error_correction, "matrix")
+
+    def image(self, payload, error_correction="L", box_size=10):
+        """Imagen de Pillow (modo "L") con `box_size` píxeles por módulo; se devuelve una copia."""
+        def build(modules):
+            pixels = np.where(modules, 0, 255).astype(np.uint8)
+            # Escalar cada módulo a box_size x box_size píxeles repitiendo filas y columnas
+            pixels = pixels.repeat(box_size, axis=0).repeat(box_size, axis=1)
+            return Image.fromarray(pixels, mode="L")
+
+        return self._cached(payload, error_correction, ("image", box_size), build).copy()
+
+    def svg(self, payload, error_correction="L", box_size=10):
+        """SVG como texto: un único <path> con un rectángulo por cada tramo horizontal de módulos negros."""
+        def build(modules):
+            size = len(modules) * box_size
+            segments = []
+            for y, row in enumerate(modules):
+                # Detectar inicio y fin de cada tramo de módulos negros en la fila
+                edges = np.flatnonzero(np.diff(np.concatenate(([0], row.astype(np.int8), [0]))))
+                for start, end in zip(edges[::2], edges[1::2]):
+                    segments.append(f"M{start * box_size} {y * box_size}h{(end - start) * box_size}"
+                                    f"v{box_size}h-{(end - start) * box_size}z")
+            return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+                    f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+                    f'<rect width="100%" height="100%" fill="#fff"/>'
+                    f'<path fill="#000" d="{"".join(segments)}"/></svg>')
+
+        return self._cached(payload, error_correction, ("svg", box_size), build)
+
+    def batch(self, payloads, output="image", error_correction="L", box_size=10):
+        """Genera los QR de varios payloads de una vez; los repetidos se calculan una sola vez."""
+        if output not in ("image", "svg", "matrix"):
+            raise ValueError(f"Salida no válida: {output}")
+
+        def build(payload):
+            if output == "matrix":
+                return self.matrix(payload, error_correction)
+            return getattr(self, output)(payload, error_correction, box_size)
+
+        unique = {payload: build(payload) for payload in dict.fromkeys(payloads)}
+        return [unique[payload] for payload in payloads]
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+qr_service = QRService()
@@ -0,0 +1,251 @@
+import os
+import threading
+import time
+import wave
+
+import numpy as np
+
+# Parámetros de la grabación en streaming (variables de entorno)
+RECORD_BLOCK = int(os.getenv("RECORD_BLOCK", "1024"))  # Muestras por bloque del callback
+RECORD_SILENCE_THRESHOLD = float(os.getenv("RECORD_SILENCE_THRESHOLD", "0.01"))  # RMS en escala [-1, 1]
+RECORD_SILENCE_SECONDS = float(os.getenv("RECORD_SILENCE_SECONDS", "1.5"))  # Silencio tras la voz que detiene la grabación
+RECORD_MAX_SECONDS = float(os.getenv("RECORD_MAX_SECONDS", "30"))
+RECORD_BUFFER_SECONDS = float(os.getenv("RECORD_BUFFER_SECONDS", "10"))  # Capacidad del buffer circular
+
+
+class RingBuffer:
+    """Buffer circular de muestras int16: el callback de audio escribe y un hilo consumidor lee."""
+
+    def __init__(self, capacity, channels=1):
+        self._data = np.zeros((capacity, channels), dtype=np.int16)
+        self._start = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self.overruns = 0  # Muestras descartadas porque el consumidor no leyó a tiempo
+
+    def write(self, frames):
+        with self._lock:
+            capacity = len(self._data)
+            if len(frames) > capacity:
+                self.overruns += len(frames) - capacity
+                frames = frames[-capacity:]
+            excess = self._size + len(frames) - capacity
+            if excess > 0:
+                # Se pierden las muestras más antiguas
+                self.overruns += excess
+                self._start = (self._start + excess) % capacity
+                self._size -= excess
+            end = (self._start + self._size) % capacity
+            first = min(len(frames), capacity - end)
+            self._data[end:end + first] = frames[:first]
+            self._data[:len(frames) - first] = frames[first:]
+            self._size += len(frames)
+
+    def read(self):
+        """Devuelve y retira todas las muestras disponibles."""
+        with self._lock:
+            capacity = len(self._data)
+            indices = (self._start + np.arange(self._size)) % capacity
+            frames = self._data[indices]
+            self._start = (self._start + self._size) % capacity
+            self._size = 0
+            return frames
+
+
+class MicrophoneSource:
+    """Micrófono a través de un InputStream de sounddevice con callback (no bloquea)."""
+
+    def __init__(self, fs=44100, channels=1, blocksize=RECORD_BLOCK):
+        self.fs = fs
+        self.channels = channels
+        self.blocksize = blocksize
+        self._stream = None
+
+    def start(self, callback, on_end):
+        import sounddevice as sd
+
+        def audio_callback(indata, frames, time_info, status):
+            callback(indata.copy())
+
+        self._stream = sd.InputStream(samplerate=self.fs, channels=self.channels, dtype="int16",
+                                      blocksize=self.blocksize, callback=audio_callback)
+        self._stream.start()
+
+    def stop(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+
+class ArraySource:
+    """Fuente de pruebas sin hardware: entrega una señal (p. ej. sintética) por bloques, como haría el micrófono.
+
+    Con realtime=True espera entre bloques lo que duraría el audio real.
+    """
+
+    def __init__(self, samples, fs, blocksize=RECORD_BLOCK, realtime=False):
+        samples = np.asarray(samples)
+        if samples.dtype != np.int16:
+            samples = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+        self.samples = samples.reshape(len(samples), -1)
+        self.fs = fs
+        self.channels = self.samples.shape[1]
+        self.blocksize = blocksize
+        self.realtime = realtime
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, callback, on_end):
+        def run():
+            for start in range(0, len(self.samples), self.blocksize):
+                if self._stop.is_set():
+                    return
+                callback(self.samples[start:start + self.blocksize])
+                if self.realtime:
+                    time.sleep(self.blocksize / self.fs)
+            on_end()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+class WavFileSource(ArraySource):
+    """Lee un WAV PCM de 16 bits y lo entrega por bloques como si viniera del micrófono."""
+
+    def __init__(self, path, blocksize=RECORD_BLOCK, realtime=False):
+        with wave.open(path, "rb") as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError("Solo se admite audio PCM de 16 bits.")
+            frames = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+            super().__init__(frames.reshape(-1, wav.getnchannels()), wav.getframerate(), blocksize, realtime)
+
+
+class StreamingRecorder:
+    """Grabación no bloqueante: el callback de la fuente escribe en un buffer circular y un hilo
+    consumidor pasa los bloques a `sink.feed(bytes)` (p. ej. un StreamingTranscriber) mientras se graba.
+
+    Se detiene con stop(), tras RECORD_SILENCE_SECONDS de silencio después de la voz, al llegar a
+    RECORD_MAX_SECONDS o cuando la fuente se agota. Si se indica `audio_file`, al terminar guarda el WAV.
+    """
+
+    def __init__(self, source, sink=None, audio_file=None, silence_threshold=RECORD_SILENCE_THRESHOLD,
+                 silence_seconds=RECORD_SILENCE_SECONDS, max_seconds=RECORD_MAX_SECONDS):
+        self.source = source
+        self.sink = sink
+        self.audio_file = audio_file
+        self.silence_threshold = silence_threshold
+        self.silence_seconds = silence_seconds
+        self.max_seconds = max_seconds
+        self.buffer = RingBuffer(max(1, int(RECORD_BUFFER_SECONDS * source.fs)), source.channels)
+        self._frames = []  # Todo lo grabado, para guardar el WAV al final
+        self._recorded = 0
+        self._silence = 0
+        self._heard_voice = False
+        self._data_ready = threading.Event()
+        self._stopping = threading.Event()
+        self._done = threading.Event()
+        self._consumer = None
+        self._lock = threading.Lock()
+        self.error = None
+        self.started_at = None  # time.monotonic() al empezar y al terminar
+        self.finished_at = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._consumer = threading.Thread(target=self._consume, daemon=True)
+        self._consumer.start()
+        try:
+            self.source.start(self._callback, self.stop)
+        except Exception as e:
+            # Sin fuente (sounddevice ausente, dispositivo ocupado) el consumidor no debe quedarse esperando
+            self.error = e
+            self.stop()
+            self._consumer.join()
+            raise
+        return self
+
+    def _callback(self, frames):
+        """Se ejecuta en el hilo de audio: solo copia al buffer y mide la energía del bloque."""
+        with self._lock:
+            # Nada se escribe después de stop(), así el consumidor no pierde el último bloque
+            if self._stopping.is_set():
+                return
+            self.buffer.write(frames)
+            self._recorded += len(frames)
+        rms = np.sqrt(np.mean((frames.astype(np.float32) / 32768) ** 2)) if len(frames) else 0.0
+        if rms >= self.silence_threshold:
+            self._heard_voice, self._silence = True, 0
+        else:
+            self._silence += len(frames)
+        self._data_ready.set()
+
+        fs = self.source.fs
+        if (self._heard_voice and self._silence >= self.silence_seconds * fs) or self._recorded >= self.max_seconds * fs:
+            self.stop()
+
+    def _consume(self):
+        try:
+            while True:
+                self._data_ready.wait(0.1)
+                self._data_ready.clear()
+                stopping = self._stopping.is_set()
+                frames = self.buffer.read()
+                if len(frames):
+                    self._frames.append(frames)
+                    if self.sink is not None:
+                        self.sink.feed(frames.tobytes())
+                if stopping:
+                    break
+            if self.audio_file and self.error is None:
+                self.save(self.audio_file)
+        except Exception as e:
+            print(f"Error al procesar la grabación: {e}")
+            self.error = e
+        finally:
+            self.finished_at = time.monotonic()
+            self._done.set()
+
+    def stop(self):
+        """Detiene la grabación; el consumidor vacía el buffer antes de terminar."""
+        with self._lock:
+            if self._stopping.is_set():
+                return
+            self._stopping.set()
+        # Desde el callback de audio no se puede cerrar el stream: se hace en otro hilo
+        threading.Thread(target=self.source.stop, daemon=True).start()
+        self._data_ready.set()
+
+    def wait(self, timeout=None):
+        """Espera a que termine la grabación; devuelve True si terminó."""
+        return self._done.wait(timeout)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def seconds(self):
+        return self._recorded / self.source.fs
+
+    def save(self, path):
+        """Guarda lo grabado como WAV PCM de 16 bits."""
+        frames = np.concatenate(self._frames) if self._frames else np.zeros((0, self.source.channels), np.int16)
+        with wave.open(path, "wb") as wav:
+            wav.setnchannels(self.source.channels)
+            wav.setsampwidth(2)
+            wav.setframerate(self.source.fs)
+            wav.writeframes(frames.astype("<i2").tobytes())
+        return path
+
+    def result(self, timeout=None):
+        """Espera al final de la grabación y devuelve el resultado del sink (p. ej. la transcripción)."""
+        if not self.wait(timeout):
+            raise TimeoutError("La grabación no terminó a tiempo.")
+        if self.error:
+            raise self.error
+        return self.sink.finish() if self.sink is not None else None
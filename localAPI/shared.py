@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Los módulos comunes (http_pool, language, logo_cache, metrics, openai_client) viven en la raíz
+# del repositorio y localAPI los importa desde allí en lugar de tener una copia propia.
+# Se añade al final de sys.path para que los módulos de localAPI (app, classArtMind) tengan prioridad.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
@@ -0,0 +1,130 @@
+import os
+import sys
+import threading
+import time
+import wave
+from io import BytesIO
+
+import numpy as np
+import pytest
+from scipy.signal import resample_poly
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_stream import (TARGET_RATE, IncompleteTranscription, StreamingTranscriber, StreamResampler,  # noqa: E402
+                          to_wav_bytes)
+from recorder import ArraySource, StreamingRecorder  # noqa: E402
+
+
+def sine(rate, seconds=2.0, frequency=440.0, amplitude=0.5):
+    return amplitude * np.sin(2 * np.pi * frequency * np.arange(int(rate * seconds)) / rate)
+
+
+def one_shot(samples, rate):
+    factor = np.gcd(rate, TARGET_RATE)
+    return resample_poly(samples, TARGET_RATE // factor, rate // factor)
+
+
+def snr_db(reference, signal):
+    noise = signal - reference
+    return 10 * np.log10(np.sum(reference ** 2) / max(np.sum(noise ** 2), 1e-30))
+
+
+def decode_wav(buffer):
+    with wave.open(buffer, "rb") as wav:
+        return np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2") / 32768.0
+
+
+class CapturingTranscriber(StreamingTranscriber):
+    """Guarda las muestras que se enviarían a Whisper en lugar de transcribirlas."""
+
+    def __init__(self, **kwargs):
+        self.chunks = []
+        super().__init__(self._capture, **kwargs)
+
+    def _capture(self, wav):
+        self.chunks.append(decode_wav(wav))
+        return "ok"
+
+    def samples(self):
+        return np.concatenate(self.chunks)
+
+
+@pytest.mark.parametrize("rate", [44100, 48000, 22050, 8000, 16000])
+@pytest.mark.parametrize("block", [1, 333, 1024, 2048, 32768])
+def test_stream_resampler_matches_one_shot(rate, block):
+    samples = np.random.default_rng(0).standard_normal(rate)
+    resampler = StreamResampler(rate, TARGET_RATE)
+    parts = [resampler.process(samples[start:start + block]) for start in range(0, len(samples), block)]
+    parts.append(resampler.process(np.zeros(0), final=True))
+    streamed = np.concatenate(parts)
+    expected = one_shot(samples, rate)
+    assert len(streamed) == len(expected)
+    np.testing.assert_allclose(streamed, expected, atol=1e-9)
+
+
+@pytest.mark.parametrize("block_bytes", [4096, 65536])
+def test_streaming_transcriber_matches_one_shot(block_bytes):
+    rate = 44100
+    samples = sine(rate)
+    wav = to_wav_bytes(samples, rate).getvalue()
+    transcriber = CapturingTranscriber()
+    for start in range(0, len(wav), block_bytes):
+        transcriber.feed(wav[start:start + block_bytes])
+    assert transcriber.finish() == "ok"
+
+    pcm = np.frombuffer(wav[44:], dtype="<i2") / 32768.0
+    expected = one_shot(pcm, rate)
+    streamed = transcriber.samples()
+    assert len(streamed) == len(expected) == 2 * TARGET_RATE
+    # Solo queda el error de cuantizar a 16 bits
+    assert snr_db(expected, streamed) > 70
+
+
+def test_recorder_blocks_into_transcriber_match_one_shot():
+    rate = 44100
+    samples = sine(rate)
+    transcriber = CapturingTranscriber(sample_rate=rate, channels=1)
+    recorder = StreamingRecorder(ArraySource(samples, rate, blocksize=1024), sink=transcriber).start()
+    assert recorder.result(timeout=10) == "ok"
+
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16) / 32768.0
+    expected = one_shot(pcm, rate)
+    streamed = transcriber.samples()
+    assert len(streamed) == len(expected)
+    assert snr_db(expected, streamed) > 70
+
+
+class BrokenSource(ArraySource):
+    def start(self, callback, on_end):
+        raise OSError("dispositivo ocupado")
+
+
+def test_failed_source_start_does_not_leak_the_consumer_thread():
+    threads = threading.active_count()
+    for _ in range(3):
+        recorder = StreamingRecorder(BrokenSource(np.zeros(10), TARGET_RATE))
+        with pytest.raises(OSError):
+            recorder.start()
+        assert recorder.done
+    time.sleep(0.05)  # Los hilos que llaman a source.stop() terminan enseguida
+    assert threading.active_count() == threads
+
+
+def test_failed_segment_is_reported_instead_of_dropped():
+    speech = sine(TARGET_RATE, seconds=3.5)
+    samples = np.concatenate([speech, np.zeros(TARGET_RATE), speech])
+    results = iter(["hola", None])
+    transcriber = StreamingTranscriber(lambda wav: next(results), sample_rate=TARGET_RATE)
+    transcriber.feed((samples * 32767).astype("<i2").tobytes())
+
+    with pytest.raises(IncompleteTranscription) as error:
+        transcriber.finish()
+    assert (error.value.failed_segments, error.value.segments, error.value.partial_text) == (1, 2, "hola")
+    assert transcriber.failed_segments == 1
+
+
+def test_to_wav_bytes_round_trip():
+    samples = sine(TARGET_RATE, seconds=0.1)
+    decoded = decode_wav(BytesIO(to_wav_bytes(samples).getvalue()))
+    assert snr_db(samples, decoded) > 70
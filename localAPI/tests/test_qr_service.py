@@ -0,0 +1,47 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qr_service import QRService  # noqa: E402
+
+URLS = [f"https://example.com/img-{i:04d}.png" for i in range(200)]
+
+
+def test_second_pass_over_urls_that_fit_is_all_hits():
+    service = QRService(max_entries=256)
+    service.batch(URLS)
+    service.batch(URLS)
+    assert service.stats() == {"hits": 200, "misses": 200, "entries": 200}
+
+
+def test_limit_is_counted_in_payloads():
+    service = QRService(max_entries=2)
+    for url in URLS[:2]:
+        service.matrix(url)
+        service.image(url)
+        service.svg(url)
+    assert service.stats()["entries"] == 2
+    # Las tres salidas de cada payload siguen en la caché
+    hits = service.hits
+    for url in URLS[:2]:
+        service.matrix(url)
+        service.image(url)
+        service.svg(url)
+    assert service.hits == hits + 6
+
+    service.image(URLS[2])
+    assert service.stats()["entries"] == 2
+    misses = service.misses
+    service.image(URLS[0])  # El menos usado recientemente salió de la caché
+    assert service.misses == misses + 1
+
+
+def test_image_reuses_the_cached_matrix():
+    service = QRService()
+    modules = service.matrix(URLS[0])
+    image = np.asarray(service.image(URLS[0], box_size=2))
+    assert image.shape == (len(modules) * 2, len(modules) * 2)
+    assert np.array_equal(image[::2, ::2] == 0, modules)
@@ -0,0 +1,82 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class LogoCache:
+    """Caché LRU de logos ya decodificados, redimensionados y con la máscara alfa separada.
+
+    La clave es (ruta del logo, tamaño objetivo, mtime), así que si el archivo del logo
+    cambia en disco se vuelve a cargar. Con esto, añadir el logo a una imagen solo cuesta un paste.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, logo_path, target_size):
+        """Decodifica el logo, lo redimensiona y separa la máscara alfa."""
+        from PIL import Image
+
+        with Image.open(logo_path) as logo:
+            logo = logo.convert("RGBA")
+        if target_size:
+            logo.thumbnail(target_size)
+        mask = logo.getchannel("A")
+        return logo.convert("RGB"), mask
+
+    def get(self, logo_path, target_size=None):
+        """Devuelve (logo RGB, máscara alfa) para el logo y tamaño máximo indicados."""
+        key = (logo_path, tuple(target_size) if target_size else None, os.path.getmtime(logo_path))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = self._load(logo_path, target_size)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def preload(self, logo_paths, sizes):
+        """Carga de antemano cada logo en cada tamaño (por ejemplo, al arrancar la app)."""
+        for logo_path in logo_paths:
+            for size in sizes:
+                try:
+                    self.get(logo_path, size)
+                except Exception as e:
+                    print(f"Error al precargar el logo {logo_path}: {e}")
+
+    def paste(self, image, logo_path, target_size=None):
+        """Pega el logo en la esquina inferior derecha de `image` (modifica la imagen)."""
+        logo, mask = self.get(logo_path, target_size)
+        image.paste(logo, (image.width - logo.width, image.height - logo.height), mask)
+        return image
+
+    def stats(self):
+        """Devuelve aciertos, fallos y número de entradas en caché."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Instancia compartida por todo el proceso
+logo_cache = LogoCache(max_entries=int(os.getenv("LOGO_CACHE_SIZE", "32")))
+
+
+def logo_size_for(image_size):
+    """Tamaño máximo del logo para una imagen: una quinta parte de cada dimensión."""
+    width, height = image_size
+    return (width // 5, height // 5)
@@ -0,0 +1,197 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Límites de los buckets de latencia, en segundos (METRICS_BUCKETS="0.01,0.1,1,10")
+DEFAULT_BUCKETS = tuple(float(value) for value in os.getenv(
+    "METRICS_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60").split(","))
+BYTES_BUCKETS = (1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def byte_size(value):
+    """Tamaño en bytes de un buffer, unos bytes o la ruta de un archivo; None si no se puede saber."""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if hasattr(value, "getbuffer"):
+        return value.getbuffer().nbytes
+    if isinstance(value, str) and os.path.isfile(value):
+        return os.path.getsize(value)
+    return None
+
+
+def is_failure(result):
+    """Los helpers del repo devuelven None (o una tupla de None) cuando fallan, en vez de lanzar."""
+    if isinstance(result, tuple):
+        return all(item is None for item in result)
+    return result is None
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.items())
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{format_labels(dict(key))} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # etiquetas: [cuentas por bucket, suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.items())
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                labels = dict(key)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': bound})} {cumulative}")
+                lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': '+Inf'})} {count}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+
+class Metrics:
+    """Registro de métricas con exposición en formato de texto de Prometheus.
+
+    Cada etapa del pipeline (timed/span) registra su latencia, los errores y, si se indica, los bytes.
+    Las métricas que ya llevan otras piezas (cachés, cliente de OpenAI) se leen al exportar con callback().
+    """
+
+    def __init__(self, prefix="artmind"):
+        self.prefix = prefix
+        self._metrics = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self.stage_seconds = self.histogram("stage_duration_seconds", "Latencia de cada etapa del pipeline.")
+        self.stage_errors = self.counter("stage_errors_total", "Errores por etapa del pipeline.")
+        self.stage_bytes = self.histogram("stage_bytes", "Tamaño de los datos que produce o sube cada etapa.",
+                                          BYTES_BUCKETS)
+
+    def _get(self, kind, name, *args):
+        name = f"{self.prefix}_{name}"
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = kind(name, *args)
+            return metric
+
+    def counter(self, name, help_text):
+        return self._get(Counter, name, help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets)
+
+    def callback(self, name, help_text, fn, kind="gauge"):
+        """Registra una métrica que se calcula al exportar: `fn()` devuelve [(etiquetas, valor)]."""
+        with self._lock:
+            self._callbacks.append((f"{self.prefix}_{name}", help_text, fn, kind))
+
+    @contextmanager
+    def span(self, stage):
+        """Mide la duración de un bloque; si lanza una excepción cuenta un error de la etapa."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.stage_errors.inc(stage=stage)
+            raise
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - start, stage=stage)
+
+    def timed(self, stage, bytes_arg=None, bytes_result=False):
+        """Decorador: latencia y errores de la etapa (excepción o resultado None).
+
+        `bytes_arg` (posición del argumento) o `bytes_result` indican de dónde medir los bytes.
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    result = fn(*args, **kwargs)
+                if is_failure(result):
+                    self.stage_errors.inc(stage=stage)
+                    return result
+                source = None
+                if bytes_result:
+                    source = result
+                elif bytes_arg is not None and len(args) > bytes_arg:
+                    source = args[bytes_arg]
+                size = byte_size(source)
+                if size is not None:
+                    self.stage_bytes.observe(size, stage=stage)
+                return result
+            return wrapper
+        return decorator
+
+    def render(self):
+        """Todas las métricas en el formato de texto de Prometheus."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            callbacks = list(self._callbacks)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for name, help_text, fn, kind in callbacks:
+            try:
+                samples = fn()
+            except Exception as e:
+                print(f"Error al leer la métrica {name}: {e}")
+                continue
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+            lines.extend(f"{name}{format_labels(labels)} {value}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+def cache_samples(caches):
+    """Muestras de aciertos y fallos a partir de {nombre de la caché: stats()} para callback()."""
+    samples = []
+    for name, stats in caches.items():
+        samples.append(({"cache": name, "result": "hit"}, stats["hits"]))
+        samples.append(({"cache": name, "result": "miss"}, stats["misses"]))
+    return samples
+
+
+# Registro compartido por todo el proceso
+metrics = Metrics()
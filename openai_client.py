@@ -0,0 +1,208 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+# Límites por modelo en peticiones por minuto: "modelo=rpm,modelo2=rpm" (variable OPENAI_RATE_LIMITS)
+DEFAULT_RATE_LIMITS = {"dall-e-3": 7, "whisper-1": 50, "gpt-3.5-turbo": 500}
+MAX_IN_FLIGHT = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "8"))
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "1.0"))  # Segundos
+BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "30.0"))
+
+
+def parse_rate_limits(value):
+    """Convierte "dall-e-3=7,whisper-1=50" en un dict de peticiones por minuto."""
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for item in (value or "").split(","):
+        if "=" in item:
+            model, rpm = item.split("=", 1)
+            limits[model.strip()] = float(rpm)
+    return limits
+
+
+_openai = None
+_openai_lock = threading.Lock()
+
+
+def get_openai():
+    """Importa y configura el SDK de OpenAI la primera vez que se usa (clave y sesión HTTP compartida).
+
+    Importar openai cuesta unos cientos de ms, así que no se hace al cargar el módulo.
+    """
+    global _openai
+    if _openai is None:
+        with _openai_lock:
+            if _openai is None:
+                import openai
+                from http_pool import use_for_openai
+
+                openai.api_key = openai.api_key or os.getenv("OPENAI_API_KEY")
+                use_for_openai()
+                _openai = openai
+    return _openai
+
+
+def is_retryable(error):
+    """429 y errores 5xx/de conexión se reintentan; los errores del cliente (4xx) no."""
+    openai = get_openai()
+    if isinstance(error, (openai.error.RateLimitError, openai.error.ServiceUnavailableError,
+                          openai.error.APIConnectionError, openai.error.Timeout, openai.error.TryAgain)):
+        return True
+    status = getattr(error, "http_status", None)
+    return status is not None and (status == 429 or status >= 500)
+
+
+class TokenBucket:
+    """Token bucket: `rate` peticiones por minuto con ráfagas de hasta `capacity`."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1.0, rate_per_minute / 60.0 * 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloquea hasta que haya un token disponible."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ClientMetrics:
+    """Profundidad de la cola, peticiones en vuelo y tiempos de espera, para dimensionar la capacidad."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.coalesced = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.wait_time_total += seconds
+            self.wait_time_max = max(self.wait_time_max, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "queue_depth": self.waiting,
+                "in_flight": self.in_flight,
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "coalesced": self.coalesced,
+                "wait_time_avg": self.wait_time_total / self.calls if self.calls else 0.0,
+                "wait_time_max": self.wait_time_max,
+            }
+
+
+class OpenAIClient:
+    """Capa sobre el SDK de OpenAI con rate limiting por modelo, límite de peticiones en vuelo,
+    reintentos con backoff exponencial con jitter y agrupación de peticiones duplicadas."""
+
+    def __init__(self, rate_limits=None, max_in_flight=MAX_IN_FLIGHT, max_retries=MAX_RETRIES):
+        rate_limits = rate_limits or parse_rate_limits(os.getenv("OPENAI_RATE_LIMITS"))
+        self.buckets = {model: TokenBucket(rpm) for model, rpm in rate_limits.items()}
+        self.max_retries = max_retries
+        self.metrics = ClientMetrics()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+
+    def _call_with_limits(self, model, fn, kwargs):
+        attempt = 0
+        while True:
+            self.metrics.add(waiting=1)
+            start = time.monotonic()
+            bucket = self.buckets.get(model)
+            if bucket:
+                bucket.acquire()
+            self._slots.acquire()
+            self.metrics.add(waiting=-1, in_flight=1)
+            self.metrics.record_wait(time.monotonic() - start)
+            try:
+                return fn(**kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self.metrics.add(failures=1)
+                    raise
+            finally:
+                self._slots.release()
+                self.metrics.add(in_flight=-1)
+            # Backoff exponencial con "full jitter" para no reintentar todos a la vez
+            attempt += 1
+            self.metrics.add(retries=1)
+            time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+
+    def call(self, model, fn, coalesce_key=None, **kwargs):
+        """Llama a `fn(model=model, **kwargs)` respetando los límites.
+
+        Si `coalesce_key` coincide con una petición que ya está en vuelo, se espera su
+        resultado en lugar de repetirla.
+        """
+        kwargs["model"] = model
+        self.metrics.add(calls=1)
+        if coalesce_key is None:
+            return self._call_with_limits(model, fn, kwargs)
+
+        key = (model, coalesce_key)
+        with self._pending_lock:
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._pending[key] = future
+        if not owner:
+            self.metrics.add(coalesced=1)
+            return future.result()
+
+        try:
+            result = self._call_with_limits(model, fn, kwargs)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._pending_lock:
+                self._pending.pop(key, None)
+
+    def create_image(self, prompt, model="dall-e-3", size="1024x1024", n=1, variation=0, **kwargs):
+        """Genera imágenes; `variation` distingue peticiones repetidas a propósito para que no se agrupen."""
+        return self.call(model, get_openai().Image.create, coalesce_key=(prompt, size, n, variation),
+                         prompt=prompt, size=size, n=n, **kwargs)
+
+    def transcribe(self, file, model="whisper-1", **kwargs):
+        def transcribe_from_start(**call_kwargs):
+            file.seek(0)  # Cada reintento vuelve a enviar el audio completo
+            return get_openai().Audio.transcribe(file=file, **call_kwargs)
+
+        return self.call(model, transcribe_from_start, **kwargs)
+
+    def chat(self, messages, model="gpt-3.5-turbo", **kwargs):
+        key = tuple((m["role"], m["content"]) for m in messages)
+        return self.call(model, get_openai().ChatCompletion.create, coalesce_key=key, messages=messages, **kwargs)
+
+
+# Instancia compartida por todo el proceso
+openai_client = OpenAIClient()
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Configuración de la caché de resultados (variables de entorno)
+CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "memory")  # "memory" o "sqlite"
+CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "86400"))  # Segundos
+CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_SIZE", "1000"))
+CACHE_SQLITE_PATH = os.getenv("RESULT_CACHE_PATH", "result_cache.sqlite3")
+
+
+def normalize_prompt(prompt):
+    """Normaliza un prompt para que variantes triviales (mayúsculas, acentos, espacios, puntuación) coincidan."""
+    text = unicodedata.normalize("NFKD", prompt)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def prompt_key(prompt, *variant):
+    """Hash SHA-256 del prompt normalizado (y de cualquier variante extra, como el logo)."""
+    raw = "|".join([normalize_prompt(prompt), *map(str, variant)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def content_path(data, prefix="generated_images", extension="png"):
+    """Ruta direccionada por contenido: el hash de los bytes, así los duplicados caen en el mismo objeto."""
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        data = data.getbuffer()
+    return f"{prefix}/{hashlib.sha256(data).hexdigest()}.{extension}"
+
+
+class MemoryBackend:
+    """Backend en memoria del proceso con TTL y expulsión LRU."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """Backend en disco (sqlite) con TTL y expulsión LRU; sobrevive a reinicios y se comparte entre procesos."""
+
+    def __init__(self, path=CACHE_SQLITE_PATH, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+
+    def _connect(self):
+        # Una conexión por hilo: sqlite3 no permite compartirlas entre hilos por defecto
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            self.delete(key)
+            return None
+        with conn:
+            conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now),
+            )
+            conn.execute("DELETE FROM results WHERE expires_at < ?", (now,))
+            conn.execute(
+                "DELETE FROM results WHERE key IN ("
+                "SELECT key FROM results ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+class ResultCache:
+    """Caché de resultados de generación indexada por el hash del prompt normalizado."""
+
+    def __init__(self, backend, ttl=CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, prompt, *variant):
+        try:
+            value = self.backend.get(prompt_key(prompt, *variant))
+        except Exception as e:
+            print(f"Error al leer la caché de resultados: {e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def delete(self, prompt, *variant):
+        try:
+            self.backend.delete(prompt_key(prompt, *variant))
+        except Exception as e:
+            print(f"Error al borrar de la caché de resultados: {e}")
+
+    def set(self, prompt, value, *variant):
+        try:
+            self.backend.set(prompt_key(prompt, *variant), value, self.ttl)
+        except Exception as e:
+            print(f"Error al escribir en la caché de resultados: {e}")
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {"hits": hits, "misses": misses, "entries": len(self.backend)}
+
+
+def build_result_cache(backend=CACHE_BACKEND):
+    """Crea la caché con el backend configurado ("memory" o "sqlite")."""
+    if backend == "sqlite":
+        return ResultCache(SQLiteBackend())
+    return ResultCache(MemoryBackend())
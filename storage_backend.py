@@ -0,0 +1,291 @@
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import quote
+
+# Backend de almacenamiento (variables de entorno)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firebase")  # firebase | local | memory
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", "storage_data")
+# URL base con la que se sirven los objetos de los backends local y en memoria (ruta /storage/ de app.py)
+STORAGE_PUBLIC_BASE_URL = os.getenv("STORAGE_PUBLIC_BASE_URL", "http://127.0.0.1:5000/storage")
+STORAGE_BATCH_WORKERS = int(os.getenv("STORAGE_BATCH_WORKERS", "8"))
+
+
+def fsync_dir(path):
+    """Sincroniza con el disco las entradas de un directorio (los renombrados y archivos nuevos)."""
+    if not hasattr(os, "O_DIRECTORY"):  # Windows no permite abrir directorios
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def read_source(source):
+    """Devuelve los bytes de `source`: bytes, un objeto tipo archivo (se lee desde el inicio) o una ruta."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if isinstance(source, str):
+        with open(source, "rb") as file:
+            return file.read()
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return source.read()
+
+
+class StorageBackend:
+    """Interfaz común de almacenamiento de objetos.
+
+    upload() sube los bytes con su content type, metadatos y ACL pública en la misma petición y
+    devuelve la URL pública sin llamadas extra. upload_many() sube un lote de objetos.
+    """
+
+    def __init__(self, batch_workers=STORAGE_BATCH_WORKERS):
+        self.batch_workers = batch_workers
+        self._executor = ThreadPoolExecutor(max_workers=batch_workers, thread_name_prefix="storage")
+
+    def public_url(self, path):
+        raise NotImplementedError
+
+    def exists(self, path):
+        raise NotImplementedError
+
+    def upload(self, source, path, content_type="application/octet-stream", metadata=None, public=True,
+               skip_if_exists=False):
+        raise NotImplementedError
+
+    def upload_stream(self, fileobj, path, content_type="application/octet-stream", metadata=None, public=True,
+                      chunk_size=None):
+        """Sube desde un flujo; por defecto lo lee entero (Firebase lo sube por bloques)."""
+        return self.upload(fileobj.read(), path, content_type, metadata, public)
+
+    def upload_many(self, items, public=True, skip_if_exists=False):
+        """Sube en paralelo [(source, path, content_type, metadata)]; devuelve las URLs en el mismo orden (None si falla)."""
+        def upload_item(item):
+            source, path, content_type, metadata = item
+            try:
+                return self.upload(source, path, content_type, metadata, public, skip_if_exists)
+            except Exception as e:
+                print(f"Error al subir {path}: {e}")
+                return None
+
+        return list(self._executor.map(upload_item, items))
+
+    def read(self, path):
+        """Devuelve (bytes, content type) de un objeto que se sirve desde este proceso, o None."""
+        return None
+
+    def connect(self):
+        """Abre la conexión con el servicio de antemano (para el calentamiento)."""
+
+
+class FirebaseStorage(StorageBackend):
+    """Firebase Storage (Google Cloud Storage). `get_bucket` inicializa Firebase en el primer uso."""
+
+    def __init__(self, get_bucket, **kwargs):
+        super().__init__(**kwargs)
+        self.get_bucket = get_bucket
+
+    def _blob(self, path, content_type, metadata, chunk_size=None):
+        blob = self.get_bucket().blob(path, chunk_size=chunk_size)
+        blob.content_type = content_type
+        if metadata:
+            blob.metadata = metadata
+        return blob
+
+    def public_url(self, path):
+        # public_url se calcula en local a partir del bucket y la ruta, sin llamar al servicio
+        return self.get_bucket().blob(path).public_url
+
+    def exists(self, path):
+        return self.get_bucket().blob(path).exists()
+
+    def upload(self, source, path, content_type="application/octet-stream", metadata=None, public=True,
+               skip_if_exists=False):
+        blob = self._blob(path, content_type, metadata)
+        # Misma ruta = mismos bytes: el objeto ya está subido y es público
+        if skip_if_exists and blob.exists():
+            return blob.public_url
+        # La ACL pública viaja en la misma petición que los datos: ya no hace falta make_public()
+        acl = "publicRead" if public else None
+        if isinstance(source, str):
+            blob.upload_from_filename(source, content_type=content_type, predefined_acl=acl)
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            blob.upload_from_string(bytes(source), content_type=content_type, predefined_acl=acl)
+        else:
+            blob.upload_from_file(source, content_type=content_type, rewind=True, predefined_acl=acl)
+        return blob.public_url
+
+    def upload_stream(self, fileobj, path, content_type="application/octet-stream", metadata=None, public=True,
+                      chunk_size=None):
+        # Con chunk_size la subida es reanudable y se envía por bloques sin cargar el archivo entero
+        blob = self._blob(path, content_type, metadata, chunk_size=chunk_size)
+        blob.upload_from_file(fileobj, content_type=content_type, predefined_acl="publicRead" if public else None)
+        return blob.public_url
+
+    def upload_many(self, items, public=True, skip_if_exists=False):
+        """Sube el lote con el transfer manager de Cloud Storage (hilos, una sola llamada)."""
+        from google.api_core.exceptions import PreconditionFailed
+        from google.cloud.storage import transfer_manager
+
+        blobs = [self._blob(path, content_type, metadata) for _, path, content_type, metadata in items]
+        pairs = [(BytesIO(read_source(source)), blob) for (source, *_), blob in zip(items, blobs)]
+        results = transfer_manager.upload_many(
+            pairs,
+            skip_if_exists=skip_if_exists,  # Si el objeto ya existe la subida falla con 412 y se da por buena
+            upload_kwargs={"predefined_acl": "publicRead" if public else None},
+            worker_type=transfer_manager.THREAD,
+            max_workers=self.batch_workers,
+            raise_exception=False,
+        )
+        urls = []
+        for blob, result in zip(blobs, results):
+            if isinstance(result, Exception) and not isinstance(result, PreconditionFailed):
+                print(f"Error al subir {blob.name}: {result}")
+                urls.append(None)
+            else:
+                urls.append(blob.public_url)
+        return urls
+
+    def connect(self):
+        self.get_bucket()
+
+
+class LocalStorage(StorageBackend):
+    """Sistema de archivos local: para pruebas de carga y ejecución sin conexión.
+
+    Cada objeto se escribe de forma atómica y duradera (fsync del archivo y del directorio antes y
+    después del renombrado) y sus metadatos van en un `<ruta>.meta.json` al lado.
+    """
+
+    def __init__(self, root=STORAGE_LOCAL_DIR, base_url=STORAGE_PUBLIC_BASE_URL, **kwargs):
+        super().__init__(**kwargs)
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+
+    def _path(self, path):
+        full_path = os.path.abspath(os.path.join(self.root, path))
+        if not full_path.startswith(self.root + os.sep):
+            raise ValueError(f"Ruta fuera del almacenamiento: {path}")
+        return full_path
+
+    def public_url(self, path):
+        return f"{self.base_url}/{quote(path)}"
+
+    def exists(self, path):
+        return os.path.exists(self._path(path))
+
+    def upload(self, source, path, content_type="application/octet-stream", metadata=None, public=True,
+               skip_if_exists=False):
+        full_path = self._path(path)
+        if skip_if_exists and os.path.exists(full_path):
+            return self.public_url(path)
+        directory = os.path.dirname(full_path)
+        self._make_dirs(directory)
+        data = read_source(source)
+        meta = {"content_type": content_type, "metadata": metadata or {}, "public": public}
+        # Primero los metadatos y después los datos: si existe el objeto, sus metadatos ya están en disco
+        for target, payload in ((full_path + ".meta.json", json.dumps(meta).encode()), (full_path, data)):
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, "wb") as file:
+                file.write(payload)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, target)
+            fsync_dir(directory)
+        return self.public_url(path)
+
+    def _make_dirs(self, directory):
+        """Crea los directorios que falten bajo la raíz y sincroniza sus entradas en el directorio padre."""
+        os.makedirs(self.root, exist_ok=True)
+        missing = []
+        while directory != self.root and not os.path.isdir(directory):
+            missing.append(directory)
+            directory = os.path.dirname(directory)
+        for directory in reversed(missing):
+            os.makedirs(directory, exist_ok=True)
+            fsync_dir(os.path.dirname(directory))
+
+    def read(self, path):
+        try:
+            full_path = self._path(path)
+            with open(full_path + ".meta.json") as file:
+                meta = json.load(file)
+            if not meta.get("public", True):
+                return None
+            with open(full_path, "rb") as file:
+                return file.read(), meta["content_type"]
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def meta(self, path):
+        """Metadatos guardados con el objeto ({content_type, metadata, public}), o None."""
+        try:
+            with open(self._path(path) + ".meta.json") as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def delete(self, path):
+        """Borra el objeto y sus metadatos (el objeto primero: sin datos ya no se considera guardado)."""
+        full_path = self._path(path)
+        for target in (full_path, full_path + ".meta.json"):
+            try:
+                os.remove(target)
+            except FileNotFoundError:
+                pass
+
+    def paths(self):
+        """Rutas de todos los objetos completos (con datos y metadatos) guardados en el directorio."""
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".meta.json") and name[:-len(".meta.json")] in files:
+                    full_path = os.path.join(directory, name[:-len(".meta.json")])
+                    yield os.path.relpath(full_path, self.root).replace(os.sep, "/")
+
+
+class MemoryStorage(StorageBackend):
+    """Almacenamiento en memoria del proceso: para benchmarks y pruebas, sin E/S de disco ni red."""
+
+    def __init__(self, base_url=STORAGE_PUBLIC_BASE_URL, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip("/")
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def public_url(self, path):
+        return f"{self.base_url}/{quote(path)}"
+
+    def exists(self, path):
+        with self._lock:
+            return path in self._objects
+
+    def upload(self, source, path, content_type="application/octet-stream", metadata=None, public=True,
+               skip_if_exists=False):
+        data = read_source(source)
+        with self._lock:
+            if not (skip_if_exists and path in self._objects):
+                self._objects[path] = (data, content_type, dict(metadata or {}), public)
+        return self.public_url(path)
+
+    def read(self, path):
+        with self._lock:
+            entry = self._objects.get(path)
+        if entry is None or not entry[3]:
+            return None
+        return entry[0], entry[1]
+
+
+def build_storage(get_bucket=None, backend=STORAGE_BACKEND):
+    """Crea el backend de almacenamiento configurado en STORAGE_BACKEND."""
+    if backend == "local":
+        return LocalStorage()
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "firebase":
+        return FirebaseStorage(get_bucket)
+    raise ValueError(f"STORAGE_BACKEND no válido: {backend}")
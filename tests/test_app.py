@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+from io import BytesIO
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.update(STORAGE_BACKEND="memory", STARTUP_WARMUP="0", IMAGE_DERIVATIVES_ENABLED="0",
+                  JOB_QUEUE_BACKEND="memory", RESULT_CACHE_BACKEND="memory")
+
+import app  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    from PIL import Image
+
+    png = BytesIO()
+    Image.new("RGB", (64, 64), "red").save(png, "PNG")
+    monkeypatch.setattr(app, "generate_image", lambda prompt, variation=0: ("revisado", "http://dalle/img.png?sig=1"))
+    monkeypatch.setattr(app, "add_logo_to_image", lambda *args, **kwargs: BytesIO(png.getvalue()))
+    app.object_checks.clear()
+    return app.app.test_client()
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("tiempo de espera agotado")
+        time.sleep(0.01)
+
+
+def test_cache_hit_checks_the_storage_at_most_once_per_interval(client, monkeypatch):
+    checks = []
+    exists = app.image_storage.exists
+    monkeypatch.setattr(app.image_storage, "exists", lambda path: checks.append(path) or exists(path))
+
+    first = client.post("/generate-image-with-logo", json={"prompt": "un perro"}).get_json()
+    for _ in range(5):
+        hit = client.post("/generate-image-with-logo", json={"prompt": "un perro"}).get_json()
+        assert hit["cached"] and hit["firebase_url"] == first["firebase_url"]
+    wait_until(lambda: checks)
+    time.sleep(0.05)
+    assert len(checks) == 1
+
+
+def test_missing_object_invalidates_the_entry_in_the_background(client):
+    client.post("/generate-image-with-logo", json={"prompt": "un gato"})
+    app.image_storage._objects.clear()
+
+    # El acierto confía en la ruta y la comprobación en segundo plano borra la entrada
+    assert client.post("/generate-image-with-logo", json={"prompt": "un gato"}).get_json()["cached"]
+    wait_until(lambda: not app.object_checks)
+    assert "cached" not in client.post("/generate-image-with-logo", json={"prompt": "un gato"}).get_json()
+
+
+def test_batch_is_queued_and_each_job_finishes(client):
+    response = client.post("/generate-images-batch", json={"prompts": ["un perro", "un gato"], "variations": 2})
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body["queued"] == 4
+    assert [(job["prompt"], job["variation"]) for job in body["jobs"]] == [
+        ("un perro", 0), ("un perro", 1), ("un gato", 0), ("un gato", 1)]
+    for job in body["jobs"]:
+        finished = client.get(f"/jobs/{job['job_id']}?wait=5").get_json()
+        assert finished["status"] == "done", finished
+
+
+def test_batch_larger_than_the_queue_is_rejected(client):
+    prompts = [f"prompt {i}" for i in range(app.job_queue.max_pending + 1)]
+    response = client.post("/generate-images-batch", json={"prompts": prompts})
+    assert response.status_code == 413
+    assert "Retry-After" not in response.headers
+
+
+def test_huge_variations_are_rejected_before_building_the_batch(client):
+    start = time.monotonic()
+    response = client.post("/generate-images-batch", json={"prompts": ["un perro"], "variations": 10 ** 9})
+    assert response.status_code == 400
+    response = client.post("/generate-images-batch",
+                           json={"items": [{"prompt": "un perro", "variations": 60}] * 10 ** 5})
+    assert response.status_code == 413
+    assert time.monotonic() - start < 1
+
+
+@pytest.mark.parametrize("variations", [0, -3, "muchas", None])
+def test_invalid_variations_are_rejected(client, variations):
+    response = client.post("/generate-images-batch", json={"prompts": ["un perro"], "variations": variations})
+    assert response.status_code == 400
+
+
+def test_full_queue_asks_to_retry(client, monkeypatch):
+    def queue_full(payloads):
+        raise app.QueueFull("La cola de generación no tiene sitio para el lote, inténtalo más tarde.")
+
+    monkeypatch.setattr(app.job_queue, "submit_many", queue_full)
+    response = client.post("/generate-images-batch", json={"prompts": ["un perro"]})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+
+
+def test_pending_upload_is_served_from_the_request_host(client, monkeypatch, tmp_path):
+    import threading
+
+    from storage_backend import MemoryStorage
+    from write_behind import WriteBehindUploader
+
+    gate = threading.Event()
+
+    class SlowStorage(MemoryStorage):
+        def upload(self, *args, **kwargs):
+            gate.wait(5)
+            return super().upload(*args, **kwargs)
+
+    uploader = WriteBehindUploader(SlowStorage(), spool_dir=str(tmp_path), workers=1, base_url=None)
+    monkeypatch.setattr(app, "write_behind", uploader)
+    try:
+        body = client.post("/generate-image-with-logo", json={"prompt": "un pez"},
+                           base_url="https://artmind.example").get_json()
+        assert body["upload_status"] == "pending"
+        assert body["local_url"].startswith("https://artmind.example/storage/generated_images/")
+        assert client.get(body["local_url"].replace("https://artmind.example", "")).status_code == 200
+    finally:
+        gate.set()
+    wait_until(lambda: not uploader.is_pending(body["local_url"].split("/storage/")[1]))
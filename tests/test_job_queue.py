@@ -0,0 +1,50 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_queue import DONE, RUNNING, JobQueue, SQLiteQueueBackend  # noqa: E402
+
+
+def test_new_process_does_not_requeue_running_jobs(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    first = SQLiteQueueBackend(path, lease_seconds=0.3)
+    first.add("a", {"prompt": "perro"})
+    assert first.take(timeout=0) == ("a", {"prompt": "perro"})
+
+    # Otro worker arranca con la misma base mientras el primero sigue con el trabajo
+    second = SQLiteQueueBackend(path, lease_seconds=0.3)
+    assert second.get("a")["status"] == RUNNING
+    # El dueño renueva la concesión, así que el trabajo no caduca
+    time.sleep(0.6)
+    assert second.take(timeout=0) is None
+
+
+def test_job_of_a_dead_process_is_taken_when_its_lease_expires(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    first = SQLiteQueueBackend(path, lease_seconds=0.2)
+    first.add("a", {"prompt": "perro"})
+    first.take(timeout=0)
+    first._running.clear()  # El proceso muere: deja de renovar la concesión
+
+    second = SQLiteQueueBackend(path, lease_seconds=0.2)
+    assert second.take(timeout=0) is None
+    time.sleep(0.3)
+    assert second.take(timeout=0) == ("a", {"prompt": "perro"})
+    assert second.take(timeout=0) is None
+
+
+def test_wait_sees_jobs_finished_by_another_process(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    worker = SQLiteQueueBackend(path)
+    waiter = JobQueue(lambda payload: payload, SQLiteQueueBackend(path), workers=0)
+    worker.add("a", {"prompt": "perro"})
+    worker.take(timeout=0)
+    threading.Timer(0.2, worker.finish, ("a", DONE), {"result": {"ok": True}}).start()
+
+    start = time.monotonic()
+    job = waiter.wait("a", timeout=10)
+    assert job["status"] == DONE and job["result"] == {"ok": True}
+    assert time.monotonic() - start < 2
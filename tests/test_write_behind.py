@@ -0,0 +1,206 @@
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage_backend import LocalStorage, MemoryStorage  # noqa: E402
+from write_behind import WriteBehindUploader  # noqa: E402
+
+PATH = "generated_images/abc.png"
+
+
+class FlakyStorage(MemoryStorage):
+    """Falla las primeras `failures` subidas; `gate` permite retener las subidas hasta que la prueba lo indique."""
+
+    def __init__(self, failures=0, gate=None):
+        super().__init__(base_url="https://bucket.example/o", batch_workers=1)
+        self.failures = failures
+        self.gate = gate
+        self.attempts = 0
+
+    def upload(self, source, path, *args, **kwargs):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("almacenamiento no disponible")
+        return super().upload(source, path, *args, **kwargs)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("tiempo de espera agotado")
+        time.sleep(0.01)
+
+
+def make_uploader(storage, spool_dir, **kwargs):
+    kwargs.setdefault("retries", 0)
+    kwargs.setdefault("backoff", 0.01)
+    return WriteBehindUploader(storage, spool_dir=str(spool_dir), workers=1,
+                               base_url="http://127.0.0.1:5000/storage", **kwargs)
+
+
+def test_enqueue_returns_final_url_and_serves_from_spool(tmp_path):
+    gate = threading.Event()
+    storage = FlakyStorage(gate=gate)
+    uploader = make_uploader(storage, tmp_path)
+
+    assert uploader.enqueue(b"png", PATH, "image/png") == "https://bucket.example/o/generated_images/abc.png"
+    assert uploader.is_pending(PATH)
+    assert uploader.read(PATH) == (b"png", "image/png")
+    assert uploader.local_url(PATH) == "http://127.0.0.1:5000/storage/generated_images/abc.png"
+
+    gate.set()
+    wait_until(lambda: not uploader.is_pending(PATH))
+    assert storage.read(PATH) == (b"png", "image/png")
+    assert uploader.read(PATH) is None
+    assert uploader.stats() == {"pending": 0, "spooled": 0, "uploaded": 1, "retried": 0, "failed": 0}
+
+
+def test_upload_is_retried_after_a_failure(tmp_path):
+    storage = FlakyStorage(failures=2)
+    uploader = make_uploader(storage, tmp_path, retries=3)
+
+    uploader.enqueue(b"png", PATH, "image/png", {"derivative": "thumb"})
+    wait_until(lambda: not uploader.is_pending(PATH))
+    assert storage.attempts == 3
+    assert storage.read(PATH) == (b"png", "image/png")
+    assert storage._objects[PATH][2] == {"derivative": "thumb"}
+    assert uploader.stats()["retried"] == 2
+
+
+def test_backoff_is_capped(tmp_path, monkeypatch):
+    sleeps = []
+    # Solo se sustituye el time de write_behind: otros hilos de la sesión siguen durmiendo de verdad
+    monkeypatch.setattr("write_behind.time", SimpleNamespace(sleep=sleeps.append))
+    uploader = make_uploader(FlakyStorage(failures=4), tmp_path, retries=4, backoff=1, max_backoff=3)
+
+    uploader._pending.add(PATH)
+    uploader.spool.upload(b"png", PATH, "image/png")
+    uploader._upload(PATH)
+    assert sleeps == [1, 2, 3, 3]
+
+
+def test_exhausted_upload_stays_in_spool_until_redrive(tmp_path):
+    storage = FlakyStorage(failures=1)
+    uploader = make_uploader(storage, tmp_path)
+    confirmed = []
+
+    uploader.enqueue(b"png", PATH, "image/png")
+    uploader.on_uploaded(PATH, lambda: confirmed.append(PATH))
+    wait_until(lambda: uploader.stats()["failed"] == 1)
+    # Sigue pendiente y se sigue sirviendo desde el spool; la caché aún no se ha confirmado
+    assert uploader.is_pending(PATH)
+    assert uploader.read(PATH) == (b"png", "image/png")
+    assert confirmed == []
+
+    uploader.start_redrive(interval=0.05)
+    wait_until(lambda: not uploader.is_pending(PATH))
+    assert storage.read(PATH) == (b"png", "image/png")
+    assert confirmed == [PATH]
+
+
+def test_on_uploaded_runs_at_once_when_nothing_is_pending(tmp_path):
+    uploader = make_uploader(FlakyStorage(), tmp_path)
+    confirmed = []
+    uploader.on_uploaded(PATH, lambda: confirmed.append(PATH))
+    assert confirmed == [PATH]
+
+
+def test_recover_uploads_what_another_process_left_in_the_spool(tmp_path):
+    # Un proceso anterior dejó el objeto en el spool y se cayó antes de subirlo
+    LocalStorage(root=str(tmp_path), batch_workers=1).upload(b"webp", PATH, "image/webp",
+                                                            {"skip_if_exists": True})
+    storage = FlakyStorage()
+    uploader = make_uploader(storage, tmp_path)
+
+    assert uploader.recover() == 1
+    wait_until(lambda: not uploader.is_pending(PATH))
+    assert storage.read(PATH) == (b"webp", "image/webp")
+    assert storage._objects[PATH][2] == {}
+    assert list(uploader.spool.paths()) == []
+
+
+def test_local_storage_round_trip_is_fsynced(tmp_path, monkeypatch):
+    synced = []
+    real_fsync = os.fsync
+
+    def fsync(fd):
+        synced.append(fd)
+        real_fsync(fd)
+
+    monkeypatch.setattr("storage_backend.os.fsync", fsync)
+    storage = LocalStorage(root=str(tmp_path / "spool"), batch_workers=1)
+    storage.upload(b"data", "a/b/c.png", "image/png", {"k": "v"})
+
+    assert storage.read("a/b/c.png") == (b"data", "image/png")
+    assert storage.meta("a/b/c.png") == {"content_type": "image/png", "metadata": {"k": "v"}, "public": True}
+    assert list(storage.paths()) == ["a/b/c.png"]
+    assert not [name for name in os.listdir(tmp_path / "spool" / "a" / "b") if name.startswith("tmp")]
+    # Archivo y directorio por cada uno de los dos objetos (metadatos y datos), más los directorios creados
+    if hasattr(os, "O_DIRECTORY"):
+        assert len(synced) >= 4 + 2
+
+    storage.delete("a/b/c.png")
+    assert storage.read("a/b/c.png") is None
+    assert list(storage.paths()) == []
+
+
+def test_local_storage_rejects_paths_outside_the_root(tmp_path):
+    storage = LocalStorage(root=str(tmp_path), batch_workers=1)
+    with pytest.raises(ValueError):
+        storage.upload(b"x", "../fuera.png")
+
+
+def test_processes_sharing_a_spool_do_not_upload_each_others_objects(tmp_path):
+    gate = threading.Event()
+    storage = FlakyStorage(gate=gate)
+    first = make_uploader(storage, tmp_path)
+    second = make_uploader(storage, tmp_path)
+
+    first.enqueue(b"png", PATH, "image/png")
+    # El segundo proceso ve el objeto en el spool, pero está reservado por el primero
+    assert second.recover() == 0
+    confirmed = []
+    second.enqueue(b"png", PATH, "image/png")
+    second.on_uploaded(PATH, lambda: confirmed.append(PATH))
+
+    gate.set()
+    wait_until(lambda: not first.is_pending(PATH))
+    assert storage.attempts == 1
+    assert second.stats()["failed"] == 0
+    # El segundo proceso confirma lo que esperaba en su siguiente reencolado
+    second.recover()
+    assert confirmed == [PATH]
+
+
+def test_object_of_a_dead_process_is_taken_when_its_claim_expires(tmp_path):
+    storage = FlakyStorage(failures=1)
+    dead = make_uploader(storage, tmp_path)
+    dead.enqueue(b"png", PATH, "image/png")
+    wait_until(lambda: dead.stats()["failed"] == 1)
+
+    other = make_uploader(storage, tmp_path, claim_seconds=60)
+    assert other.recover() == 0
+    stale = time.time() - 120
+    os.utime(dead._claim_path(PATH), (stale, stale))
+    assert other.recover() == 1
+    wait_until(lambda: not other.is_pending(PATH))
+    assert storage.read(PATH) == (b"png", "image/png")
+    assert os.listdir(other._claims_dir) == []
+
+
+def test_local_url_uses_the_request_root_when_no_base_url_is_configured(tmp_path):
+    uploader = WriteBehindUploader(FlakyStorage(), spool_dir=str(tmp_path), workers=1, base_url=None)
+    assert (uploader.local_url(PATH, "https://artmind.example/")
+            == "https://artmind.example/storage/generated_images/abc.png")
+    configured = make_uploader(FlakyStorage(), tmp_path)
+    assert (configured.local_url(PATH, "https://artmind.example/")
+            == "http://127.0.0.1:5000/storage/generated_images/abc.png")
@@ -0,0 +1,165 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from logo_cache import logo_cache
+
+POSITIONS = ("top-left", "top-right", "bottom-left", "bottom-right", "center")
+
+
+class Watermark:
+    """Marca de agua con mezcla alfa vectorizada en NumPy.
+
+    - Posición fija: solo se mezcla el recorte de la imagen que cubre el logo.
+    - Mosaico (tiled=True): el logo, opcionalmente girado `angle` grados, se repite por toda la imagen.
+    - apply_batch mezcla muchas imágenes del mismo tamaño en una sola operación.
+    """
+
+    def __init__(self, logo_path="logo.png", opacity=1.0, position="bottom-right", margin=0,
+                 scale=0.2, tiled=False, angle=0, spacing=0.5):
+        if position not in POSITIONS:
+            raise ValueError(f"Posición no válida: {position}")
+        self.logo_path = logo_path
+        self.opacity = min(max(float(opacity), 0.0), 1.0)
+        self.position = position
+        self.margin = int(margin)
+        self.scale = scale  # Tamaño máximo del logo como fracción de la imagen
+        self.tiled = tiled
+        self.angle = angle
+        self.spacing = spacing  # Separación entre repeticiones, como fracción del tamaño del logo
+        self._layers = {}
+        self._lock = threading.Lock()
+
+    def _logo_arrays(self, image_size):
+        """Devuelve (rgb uint16, alfa uint16 0-255 ya con la opacidad) del logo para este tamaño de imagen."""
+        target = (max(1, int(image_size[0] * self.scale)), max(1, int(image_size[1] * self.scale)))
+        logo, mask = logo_cache.get(self.logo_path, target)
+        if self.angle:
+            rgba = logo.copy()
+            rgba.putalpha(mask)
+            rgba = rgba.rotate(self.angle, resample=Image.BICUBIC, expand=True)
+            logo, mask = rgba.convert("RGB"), rgba.getchannel("A")
+        rgb = np.asarray(logo, dtype=np.uint16)
+        alpha = np.rint(np.asarray(mask, dtype=np.float32) * self.opacity).astype(np.uint16)[..., None]
+        return rgb, alpha
+
+    def _offset(self, image_size, logo_size):
+        width, height = image_size
+        logo_width, logo_height = logo_size
+        x = {"top-left": self.margin, "bottom-left": self.margin,
+             "top-right": width - logo_width - self.margin, "bottom-right": width - logo_width - self.margin,
+             "center": (width - logo_width) // 2}[self.position]
+        y = {"top-left": self.margin, "top-right": self.margin,
+             "bottom-left": height - logo_height - self.margin, "bottom-right": height - logo_height - self.margin,
+             "center": (height - logo_height) // 2}[self.position]
+        return max(0, x), max(0, y)
+
+    def _layer(self, image_size):
+        """Teselas precalculadas para un tamaño de imagen: [(caja, rgb premultiplicado, 255 - alfa)]."""
+        with self._lock:
+            layer = self._layers.get(image_size)
+        if layer is not None:
+            return layer
+
+        rgb, alpha = self._logo_arrays(image_size)
+        width, height = image_size
+        logo_height, logo_width = rgb.shape[:2]
+        if self.tiled:
+            # Mosaico: filas alternas desplazadas media repetición forman un patrón en diagonal
+            step_x = max(1, int(logo_width * (1 + self.spacing)))
+            step_y = max(1, int(logo_height * (1 + self.spacing)))
+            origins = [(x, y) for row, y in enumerate(range(0, height, step_y))
+                       for x in range(-(step_x // 2) * (row % 2), width, step_x)]
+        else:
+            origins = [self._offset(image_size, (logo_width, logo_height))]
+
+        premultiplied = rgb * alpha
+        inverse_alpha = 255 - alpha
+        layer = []
+        for x, y in origins:
+            # Recortar la tesela a los bordes de la imagen
+            x0, y0 = max(x, 0), max(y, 0)
+            x1, y1 = min(x + logo_width, width), min(y + logo_height, height)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            lx, ly = x0 - x, y0 - y
+            window = (slice(ly, ly + y1 - y0), slice(lx, lx + x1 - x0))
+            layer.append(((x0, y0, x1, y1), premultiplied[window], inverse_alpha[window]))
+
+        with self._lock:
+            self._layers[image_size] = layer
+        return layer
+
+    @staticmethod
+    def _blend(region, premultiplied, inverse_alpha):
+        # out = (logo * a + fondo * (255 - a)) / 255, redondeado, en enteros
+        blended = premultiplied + region.astype(np.uint32) * inverse_alpha + 127
+        return (blended // 255).astype(np.uint8)
+
+    def apply(self, image):
+        """Aplica la marca de agua sobre `image` (RGB, se modifica en el sitio, como paste) y la devuelve.
+
+        Solo se convierten a NumPy los recortes que cubre el logo, no la imagen completa.
+        """
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        for box, premultiplied, inverse_alpha in self._layer(image.size):
+            region = np.asarray(image.crop(box))
+            image.paste(Image.fromarray(self._blend(region, premultiplied, inverse_alpha)), box)
+        return image
+
+    def apply_batch(self, images):
+        """Aplica la marca de agua a varias imágenes; los recortes de las del mismo tamaño se mezclan juntos."""
+        images = [image if image.mode == "RGB" else image.convert("RGB") for image in images]
+        by_size = {}
+        for image in images:
+            by_size.setdefault(image.size, []).append(image)
+        for size, group in by_size.items():
+            for box, premultiplied, inverse_alpha in self._layer(size):
+                stack = np.stack([np.asarray(image.crop(box)) for image in group])
+                blended = self._blend(stack, premultiplied, inverse_alpha)
+                for image, pixels in zip(group, blended):
+                    image.paste(Image.fromarray(pixels), box)
+        return images
+
+
+# Las Watermark en caché guardan los arrays del logo: se limita su número y se redondean las opciones
+WATERMARK_CACHE_SIZE = int(os.getenv("WATERMARK_CACHE_SIZE", "16"))
+OPACITY_STEP = 0.05
+ANGLE_STEP = 5
+
+_watermarks = OrderedDict()
+_watermarks_lock = threading.Lock()
+
+
+def quantize_options(options):
+    """Redondea la opacidad a pasos de OPACITY_STEP y el ángulo a pasos de ANGLE_STEP grados.
+
+    Así las opciones casi iguales comparten la misma Watermark (y la misma entrada de caché).
+    """
+    options = dict(options)
+    if "opacity" in options:
+        options["opacity"] = round(round(float(options["opacity"]) / OPACITY_STEP) * OPACITY_STEP, 2)
+    if "angle" in options:
+        options["angle"] = (round(float(options["angle"]) / ANGLE_STEP) * ANGLE_STEP) % 360
+    return options
+
+
+def get_watermark(logo_path="logo.png", **options):
+    """Devuelve una Watermark compartida para estas opciones (sus capas precalculadas se reutilizan).
+
+    Las instancias se guardan en una caché LRU de WATERMARK_CACHE_SIZE entradas.
+    """
+    options = quantize_options(options)
+    key = (logo_path, tuple(sorted(options.items())))
+    with _watermarks_lock:
+        watermark = _watermarks.get(key)
+        if watermark is None:
+            watermark = _watermarks[key] = Watermark(logo_path, **options)
+            while len(_watermarks) > WATERMARK_CACHE_SIZE:
+                _watermarks.popitem(last=False)
+        _watermarks.move_to_end(key)
+        return watermark
@@ -0,0 +1,276 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from metrics import metrics
+from storage_backend import STORAGE_PUBLIC_BASE_URL, LocalStorage
+
+# Subida diferida (variables de entorno)
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_SPOOL_DIR = os.getenv("WRITE_BEHIND_SPOOL_DIR", "upload_spool")
+WRITE_BEHIND_WORKERS = int(os.getenv("WRITE_BEHIND_WORKERS", "4"))
+WRITE_BEHIND_RETRIES = int(os.getenv("WRITE_BEHIND_RETRIES", "5"))
+WRITE_BEHIND_BACKOFF = float(os.getenv("WRITE_BEHIND_BACKOFF", "0.5"))  # Segundos; se duplica en cada reintento
+WRITE_BEHIND_MAX_BACKOFF = float(os.getenv("WRITE_BEHIND_MAX_BACKOFF", "30"))
+# Cada cuántos segundos se vuelve a encolar lo que sigue en el spool (subidas que agotaron los reintentos)
+WRITE_BEHIND_REDRIVE_SECONDS = float(os.getenv("WRITE_BEHIND_REDRIVE_SECONDS", "60"))
+# Cada objeto del spool lo reserva un proceso; si no renueva la reserva en este tiempo (murió), otro lo retoma
+WRITE_BEHIND_CLAIM_SECONDS = float(os.getenv("WRITE_BEHIND_CLAIM_SECONDS", "300"))
+# URL base con la que este proceso sirve los objetos del spool (ruta /storage/ de app.py).
+# Sin configurar, se construye con la URL de la petición (local_url con request_root)
+WRITE_BEHIND_BASE_URL = os.getenv("WRITE_BEHIND_BASE_URL")
+
+
+class WriteBehindUploader:
+    """Subidas diferidas: el objeto se guarda en un spool local y se sube en segundo plano.
+
+    enqueue() escribe los bytes en el spool (de forma atómica y con fsync, con sus metadatos al lado)
+    y devuelve ya la URL final del almacenamiento, que es determinista. Un pool de hilos sube los
+    objetos con reintentos y los borra del spool al terminar; mientras tanto read() los sirve desde
+    el disco. Lo que quede en el spool (caída del proceso o reintentos agotados) se vuelve a encolar
+    con recover(), que start_redrive() repite cada WRITE_BEHIND_REDRIVE_SECONDS hasta que se sube.
+
+    Varios procesos (workers de gunicorn) pueden compartir el spool: cada objeto se reserva con un
+    archivo en `<spool>/.claims/` creado en exclusiva, que su dueño renueva en cada recover(). Un
+    proceso solo sube lo que ha reservado, y retoma los objetos de otro cuando su reserva lleva
+    WRITE_BEHIND_CLAIM_SECONDS sin renovarse.
+    """
+
+    def __init__(self, storage, spool_dir=WRITE_BEHIND_SPOOL_DIR, workers=WRITE_BEHIND_WORKERS,
+                 retries=WRITE_BEHIND_RETRIES, backoff=WRITE_BEHIND_BACKOFF, max_backoff=WRITE_BEHIND_MAX_BACKOFF,
+                 claim_seconds=WRITE_BEHIND_CLAIM_SECONDS, base_url=WRITE_BEHIND_BASE_URL):
+        self.storage = storage
+        self.base_url = base_url
+        self.spool = LocalStorage(root=spool_dir, base_url=base_url or STORAGE_PUBLIC_BASE_URL, batch_workers=1)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.claim_seconds = claim_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"  # Dueño de las reservas de este proceso
+        self._claims_dir = os.path.join(self.spool.root, ".claims")
+        os.makedirs(self._claims_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="write-behind")
+        self._pending = set()  # Rutas en cola o subiéndose
+        self._callbacks = {}  # Ruta: funciones que se llaman cuando la subida se confirma
+        self._lock = threading.Lock()
+        self._redrive = None
+        self.uploaded = 0
+        self.failed = 0
+        self.retried = 0
+
+    def enqueue(self, source, path, content_type="application/octet-stream", metadata=None, skip_if_exists=False):
+        """Guarda el objeto en el spool, programa su subida y devuelve la URL pública final."""
+        with self._lock:
+            # Rutas direccionadas por contenido: si ya está en cola, son los mismos bytes
+            already_pending = path in self._pending
+            self._pending.add(path)
+        if not already_pending:
+            try:
+                if not self._claim(path):
+                    # Otro proceso ya sube estos mismos bytes (rutas direccionadas por contenido)
+                    with self._lock:
+                        self._pending.discard(path)
+                    return self.storage.public_url(path)
+                self.spool.upload(source, path, content_type, {**(metadata or {}), "skip_if_exists": skip_if_exists})
+            except Exception:
+                with self._lock:
+                    self._pending.discard(path)
+                self._release(path)
+                raise
+            self._executor.submit(self._upload, path)
+        return self.storage.public_url(path)
+
+    def _claim_path(self, path):
+        return os.path.join(self._claims_dir, quote(path, safe=""))
+
+    def _claim(self, path):
+        """Reserva el objeto para este proceso; False si lo tiene reservado otro proceso vivo."""
+        claim_path = self._claim_path(path)
+        for _ in range(2):
+            try:
+                fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    with open(claim_path) as file:
+                        owner = file.read()
+                    claimed_at = os.path.getmtime(claim_path)
+                except FileNotFoundError:
+                    continue  # Se acaba de liberar: se intenta crear otra vez
+                if owner == self.owner:
+                    return True
+                if time.time() - claimed_at < self.claim_seconds:
+                    return False
+                # Reserva caducada: el renombrado es atómico, así que solo un proceso la aparta
+                stale_path = f"{claim_path}.{self.owner}"
+                try:
+                    os.rename(claim_path, stale_path)
+                except FileNotFoundError:
+                    return False
+                if time.time() - os.path.getmtime(stale_path) < self.claim_seconds:
+                    # Entre tanto su dueño la renovó u otro proceso la tomó: se devuelve a su sitio
+                    try:
+                        os.link(stale_path, claim_path)
+                    except FileExistsError:
+                        pass
+                    os.remove(stale_path)
+                    return False
+                os.remove(stale_path)
+                continue
+            with os.fdopen(fd, "w") as file:
+                file.write(self.owner)
+            return True
+        return False
+
+    def _release(self, path):
+        try:
+            os.remove(self._claim_path(path))
+        except FileNotFoundError:
+            pass
+
+    def _refresh_claims(self):
+        """Renueva las reservas de los objetos que este proceso tiene en cola o subiéndose."""
+        with self._lock:
+            pending = list(self._pending)
+        for path in pending:
+            try:
+                os.utime(self._claim_path(path))
+            except FileNotFoundError:
+                pass
+
+    def _finish(self, path, uploaded):
+        """Deja de tratar el objeto como pendiente y confirma la subida a quien la esperaba."""
+        with self._lock:
+            self._pending.discard(path)
+            if uploaded:
+                self.uploaded += 1
+            callbacks = self._callbacks.pop(path, [])
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error al confirmar la subida diferida de {path}: {e}")
+
+    def _upload(self, path):
+        meta = self.spool.meta(path)
+        if meta is None:
+            # Otro proceso lo subió y lo borró del spool antes de que empezara este intento
+            self._release(path)
+            self._finish(path, uploaded=False)
+            return
+        metadata = dict(meta["metadata"])
+        skip_if_exists = metadata.pop("skip_if_exists", False)
+        for attempt in range(self.retries + 1):
+            try:
+                with metrics.span("write_behind_upload"):
+                    self.storage.upload(os.path.join(self.spool.root, path), path, meta["content_type"],
+                                        metadata or None, skip_if_exists=skip_if_exists)
+                # Primero se borra del spool y después deja de estar pendiente: read() lo sirve hasta el final
+                self.spool.delete(path)
+                self._release(path)
+                self._finish(path, uploaded=True)
+                return
+            except Exception as e:
+                if not self.spool.exists(path):
+                    # El archivo desapareció del spool: otro proceso ya lo subió
+                    self._release(path)
+                    self._finish(path, uploaded=False)
+                    return
+                print(f"Error en la subida diferida de {path} (intento {attempt + 1}): {e}")
+                if attempt < self.retries:
+                    with self._lock:
+                        self.retried += 1
+                    time.sleep(min(self.backoff * 2 ** attempt, self.max_backoff))
+        # Reintentos agotados: el objeto se queda en el spool, reservado y servido, hasta el siguiente recover()
+        with self._lock:
+            self._pending.discard(path)
+            self.failed += 1
+
+    def recover(self):
+        """Renueva las reservas propias y vuelve a encolar los objetos del spool que este proceso tiene
+        reservados o que nadie reserva (o cuya reserva caducó); devuelve cuántos."""
+        self._refresh_claims()
+        count = 0
+        for path in self.spool.paths():
+            with self._lock:
+                if path in self._pending:
+                    continue
+            if not self._claim(path):
+                continue
+            with self._lock:
+                if path in self._pending:
+                    continue
+                self._pending.add(path)
+            self._executor.submit(self._upload, path)
+            count += 1
+        # Objetos que esperaba este proceso y que otro proceso ya subió
+        with self._lock:
+            waiting = [path for path in self._callbacks if path not in self._pending]
+        for path in waiting:
+            if not self.spool.exists(path):
+                self._finish(path, uploaded=False)
+        return count
+
+    def start_redrive(self, interval=WRITE_BEHIND_REDRIVE_SECONDS):
+        """Hilo en segundo plano que llama a recover() cada `interval` segundos."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.recover()
+                except Exception as e:
+                    print(f"Error al reencolar el spool de subidas: {e}")
+
+        if self._redrive is None:
+            self._redrive = threading.Thread(target=loop, name="write-behind-redrive", daemon=True)
+            self._redrive.start()
+        return self
+
+    def is_pending(self, path):
+        """Indica si el objeto aún no está subido: en cola, subiéndose o esperando en el spool."""
+        with self._lock:
+            if path in self._pending:
+                return True
+        return self.spool.exists(path)
+
+    def on_uploaded(self, path, callback):
+        """Llama a `callback()` cuando la subida de `path` se confirme (o ya, si no está pendiente)."""
+        with self._lock:
+            if path in self._pending or self.spool.exists(path):
+                self._callbacks.setdefault(path, []).append(callback)
+                return
+        callback()
+
+    def local_url(self, path, request_root=None):
+        """URL con la que este proceso sirve el objeto mientras no termine de subirse.
+
+        Sin WRITE_BEHIND_BASE_URL se construye con la URL raíz de la petición (`request_root`),
+        así el cliente no recibe una dirección de loopback.
+        """
+        if self.base_url is None and request_root:
+            return f"{request_root.rstrip('/')}/storage/{quote(path)}"
+        return self.spool.public_url(path)
+
+    def read(self, path):
+        """(bytes, content type) del objeto si todavía está en el spool, o None."""
+        return self.spool.read(path)
+
+    def stats(self):
+        spooled = sum(1 for _ in self.spool.paths())
+        with self._lock:
+            return {"pending": len(self._pending), "spooled": spooled, "uploaded": self.uploaded,
+                    "retried": self.retried, "failed": self.failed}
+
+
+def build_write_behind(storage, enabled=WRITE_BEHIND):
+    """Crea el uploader diferido si WRITE_BEHIND=1, reencola lo que quedó en el spool y arranca el
+    reencolado periódico; None si está desactivado."""
+    if not enabled:
+        return None
+    uploader = WriteBehindUploader(storage)
+    recovered = uploader.recover()
+    if recovered:
+        print(f"Subida diferida: {recovered} objetos pendientes en el spool")
+    return uploader.start_redrive()